@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+# --- AGENT OUTPUT CACHE (SQLite, content-addressed) ---
+# Keyed by sha256(normalised input + agent fingerprint). The fingerprint covers
+# model id, description, instructions and response schema, so editing a prompt
+# or switching models automatically stops old entries from matching.
+
+AGENT_CACHE_PATH = os.getenv("AGENT_CACHE_PATH", "./rag_data/agent_cache.sqlite3")
+AGENT_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_CACHE_MAX_ENTRIES", "5000"))
+CACHE_VERSION = "1"  # Bump to drop every cached output
+
+def normalise_text(text: str) -> str:
+    lines = (re.sub(r"\s+", " ", line).strip() for line in text.strip().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def agent_fingerprint(agent: Any) -> str:
+    response_model = getattr(agent, "response_model", None)
+    parts = {
+        "version": CACHE_VERSION,
+        "name": getattr(agent, "name", None),
+        "model": getattr(getattr(agent, "model", None), "id", None),
+        "description": getattr(agent, "description", None),
+        "instructions": getattr(agent, "instructions", None),
+        "schema": response_model.model_json_schema() if response_model is not None else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class AgentOutputCache:
+    def __init__(self, path: str = AGENT_CACHE_PATH, max_entries: int = AGENT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS agent_cache ("
+                " key TEXT PRIMARY KEY, agent TEXT NOT NULL, value TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_cache_last_used ON agent_cache(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(agent: Any, text: str) -> str:
+        payload = f"{agent_fingerprint(agent)}\x1f{normalise_text(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value FROM agent_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE agent_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, agent_name: str, value: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO agent_cache (key, agent, value, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, agent_name, value, now, now),
+            )
+            # Size bound: drop least recently used rows beyond max_entries
+            db.execute(
+                "DELETE FROM agent_cache WHERE key IN ("
+                " SELECT key FROM agent_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM agent_cache").fetchone()[0]
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+agent_cache = AgentOutputCache()
+
+def cached_agent_json(agent: Any, text: str, compute, use_cache: bool = True) -> str:
+    """Return the cached JSON for `agent` on `text`, or call `compute()` and store its JSON."""
+    if not use_cache:
+        return compute()
+    key = AgentOutputCache.make_key(agent, text)
+    cached = agent_cache.get(key)
+    if cached is not None:
+        return cached
+    value = compute()
+    agent_cache.put(key, getattr(agent, "name", "agent"), value)
+    return value
@@ -1,6 +1,10 @@
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.models.groq import Groq
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_client import groq_client_kwargs  # Shared Groq connection pool
 # from agno.tools.yfinance import YFinanceTools
 # from agno.knowledge.pdf import PDFKnowledge
 # from agno.vectordb.lancedb import LanceDb
@@ -20,7 +24,7 @@ os.environ["OPEN_AI_API_KEY"] = os.getenv("OPEN_AI_API_KEY")
 os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")  # Fixed: was "GROQ_AI_API_KEY"
 
 agent = Agent(
-    model=Groq(id="llama-3.3-70b-versatile"),  # Fixed: Changed to valid model with tool support
+    model=Groq(id="llama-3.3-70b-versatile", **groq_client_kwargs()),  # Fixed: Changed to valid model with tool support
     description="You are an ai agent that provides information",
     tools=[DuckDuckGoTools()],
     markdown=True
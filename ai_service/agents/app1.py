@@ -1,6 +1,10 @@
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
 from agno.models.groq import Groq
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_client import groq_client_kwargs  # Shared Groq connection pool
 from agno.team import Team
 from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.tools.yfinance import YFinanceTools
@@ -15,7 +19,7 @@ os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
 web_agent = Agent(
     name="Web Agent",
     role="Search the web for latest news, growth drivers, and risks",
-    model=Groq(id="llama-3.3-70b-versatile"),  # ✅ CHANGED
+    model=Groq(id="llama-3.3-70b-versatile", **groq_client_kwargs()),  # ✅ CHANGED
     tools=[DuckDuckGoTools()],
     instructions="Always include sources at the end. Focus on November 2025 updates.",
     markdown=True,
@@ -24,7 +28,7 @@ web_agent = Agent(
 finance_agent = Agent(
     name="Finance Agent",
     role="Fetch and table-ize latest financials (revenue, EPS, etc.)",
-    model=Groq(id="llama-3.3-70b-versatile"),  # ✅ CHANGED
+    model=Groq(id="llama-3.3-70b-versatile", **groq_client_kwargs()),  # ✅ CHANGED
     tools=[YFinanceTools()],
     instructions="Display data in clear tables. Include YTD returns and valuations.",
     markdown=True,
@@ -32,7 +36,7 @@ finance_agent = Agent(
 
 agent_team = Team(
     members=[web_agent, finance_agent],
-    model=Groq(id="llama-3.3-70b-versatile"),  # ✅ CHANGED
+    model=Groq(id="llama-3.3-70b-versatile", **groq_client_kwargs()),  # ✅ CHANGED
     instructions=["Include sources", "Use tables for financials", "Base on Nov 2025 data"],
     markdown=True,
 )
@@ -11,40 +11,176 @@ sys.path.append(parent_dir)
 from phi.agent import Agent
 from phi.model.google import Gemini
 from dotenv import load_dotenv
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+import re
+import time
+import threading
 import sys
 import os
 
 # Import the RAG engine we just built
-from rag_engine import get_rag_response
+from rag_engine import get_rag_response, get_rag_context, stream_rag_response
 
 load_dotenv()
 
-# --- THE HYBRID AGENT ---
-# We use Gemini for "Chat" but we call the Groq RAG Engine for "Knowledge"
-chatbot = Agent(
-    name="FinAdapt Chat",
-    model=Gemini(id="gemini-2.5-pro"),
-    description="You are a financial assistant backed by a powerful knowledge base.",
-    instructions=[
-        "You are the interface for FinAdapt.",
-        "When a user asks a specific question about FinAdapt features, policies, or financial rules:",
-        "1. DO NOT guess.",
+# "context": the tool hands Gemini ranked excerpts and Gemini writes the only answer.
+# "answer": the tool runs a full Groq RAG answer that Gemini then rephrases (two generations).
+CHAT_TOOL_MODE = os.getenv("CHAT_TOOL_MODE", "context").lower()
+# Short factual lookups skip Gemini and get one Groq RAG generation
+CHAT_ROUTER = os.getenv("CHAT_ROUTER", "true").lower() == "true"
+CHAT_ROUTER_MAX_WORDS = int(os.getenv("CHAT_ROUTER_MAX_WORDS", "20"))
+
+if CHAT_TOOL_MODE == "answer":
+    tool_instructions = [
         "2. Use the 'consult_knowledge_base' tool to get the answer.",
         "3. Rephrase the tool's answer nicely for the user."
-    ],
-    markdown=True
-)
+    ]
+else:
+    tool_instructions = [
+        "2. Use the 'consult_knowledge_base' tool; it returns document excerpts, most relevant first.",
+        "3. Answer from those excerpts. If they don't cover the question, say so."
+    ]
+
+# The user the current run is for; the tool reads it so retrieval stays scoped to them
+_current_user: ContextVar[Optional[str]] = ContextVar("chat_user_id", default=None)
+# Per-hop timings of the current run, filled in by the tool
+_current_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("chat_timings", default=None)
 
 # --- DEFINE THE TOOL ---
 def consult_knowledge_base(query: str) -> str:
     """Use this tool to search documents for specific answers about FinAdapt or finance."""
-    return get_rag_response(query)
+    timings = _current_timings.get()
+    started = time.perf_counter()
+    if CHAT_TOOL_MODE == "answer":
+        result = get_rag_response(query, tenant_id=_current_user.get(), timings=timings)
+    else:
+        result = get_rag_context(query, tenant_id=_current_user.get(), timings=timings)
+    if timings is not None:
+        timings["tool"] = round(timings.get("tool", 0.0) + (time.perf_counter() - started) * 1000, 2)
+    return result
+
+# --- THE HYBRID AGENT ---
+# We use Gemini for "Chat" but we call the Groq RAG Engine for "Knowledge"
+def build_chatbot_agent() -> Agent:
+    return Agent(
+        name="FinAdapt Chat",
+        model=Gemini(id="gemini-2.5-pro"),
+        description="You are a financial assistant backed by a powerful knowledge base.",
+        instructions=[
+            "You are the interface for FinAdapt.",
+            "When a user asks a specific question about FinAdapt features, policies, or financial rules:",
+            "1. DO NOT guess.",
+            *tool_instructions
+        ],
+        tools=[consult_knowledge_base],
+        markdown=True
+    )
+
+# Turns never share an Agent: phi keeps per-run state (run_id, run_response, memory)
+# on it, and overlapping turns could swap answers built from different users' uploads.
+_thread_agents = threading.local()
+
+def _worker_agent() -> Agent:
+    agent = getattr(_thread_agents, "agent", None)
+    if agent is None:
+        agent = build_chatbot_agent()
+        _thread_agents.agent = agent
+    return agent
+
+# --- ROUTER (Skip the outer agent for simple lookups) ---
+_LOOKUP_START = re.compile(
+    r"^\s*(what|what's|whats|which|who|when|where|define|explain|how much|how many|how long|"
+    r"is|are|does|do|can)\b", re.IGNORECASE
+)
+# Advice, planning and multi-part requests need the conversational agent
+_NEEDS_AGENT = re.compile(
+    r"\b(should i|recommend|suggest|advice|advise|plan|planning|strategy|compare|versus|vs|"
+    r"help me|better|best for me|and also)\b", re.IGNORECASE
+)
+
+def route_query(query: str) -> str:
+    """'direct' (one Groq RAG generation) or 'agent' (Gemini + knowledge tool)."""
+    if not CHAT_ROUTER:
+        return "agent"
+    if len(query.split()) > CHAT_ROUTER_MAX_WORDS or query.count("?") > 1:
+        return "agent"
+    if _LOOKUP_START.search(query) and not _NEEDS_AGENT.search(query):
+        return "direct"
+    return "agent"
+
+class HopStats:
+    """Call count and mean milliseconds per (route, hop), served on /metrics."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, list]] = {}
+
+    def record(self, route: str, timings: Dict[str, float]):
+        with self._lock:
+            hops = self._totals.setdefault(route, {})
+            for hop, ms in timings.items():
+                total = hops.setdefault(hop, [0, 0.0])
+                total[0] += 1
+                total[1] += ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                route: {hop: {"count": n, "avg_ms": round(total / n, 2)} for hop, (n, total) in hops.items()}
+                for route, hops in self._totals.items()
+            }
+
+hop_stats = HopStats()
+
+def ask_chatbot(query: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Answer a chat turn for `user_id` (retrieval limited to their documents + shared ones).
+
+    Returns {"answer", "route", "timings_ms"}; timings cover each hop (retrieve, context,
+    generate / agent, tool) plus the total.
+    """
+    route = route_query(query)
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    if route == "direct":
+        answer = get_rag_response(query, use_cache=True, tenant_id=user_id, timings=timings)
+    else:
+        user_token, timings_token = _current_user.set(user_id), _current_timings.set(timings)
+        try:
+            answer = _worker_agent().run(query).content
+        finally:
+            _current_user.reset(user_token)
+            _current_timings.reset(timings_token)
+        # Gemini's own time: the whole run minus the knowledge tool
+        timings["agent"] = round((time.perf_counter() - started) * 1000 - timings.get("tool", 0.0), 2)
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    hop_stats.record(route, timings)
+    return {"answer": answer, "route": route, "timings_ms": timings}
 
-# Add the tool to the agent
-chatbot.tools = [consult_knowledge_base]
+def stream_chatbot(query: str, user_id: Optional[str] = None) -> Iterator[str]:
+    """ask_chatbot, yielding the reply text as it is generated (Groq or Gemini, per the router)."""
+    route = route_query(query)
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    if route == "direct":
+        yield from stream_rag_response(query, use_cache=True, tenant_id=user_id, timings=timings)
+    else:
+        user_token, timings_token = _current_user.set(user_id), _current_timings.set(timings)
+        try:
+            for chunk in _worker_agent().run(query, stream=True):
+                if chunk.content:
+                    yield chunk.content
+        finally:
+            _current_user.reset(user_token)
+            _current_timings.reset(timings_token)
+        timings["agent"] = round((time.perf_counter() - started) * 1000 - timings.get("tool", 0.0), 2)
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    hop_stats.record(route, timings)
 
 # --- TEST ---
 if __name__ == "__main__":
+    for question in ["What is the 80C limit?", "Should I move my savings into ELSS or PPF?"]:
+        print(f"🧭 {question!r} -> {route_query(question)}")
     print("💬 Asking RAG: 'What is FinAdapt?'")
-    response = chatbot.run("What is the core mission of FinAdapt?")
-    print(response.content)
\ No newline at end of file
+    result = ask_chatbot("What is the core mission of FinAdapt?")
+    print(result["answer"])
+    print(f"⏱️ {result['route']}: {result['timings_ms']}")
@@ -1,12 +1,28 @@
 from phi.agent import Agent                # Changed from agno.agent
 from phi.model.google import Gemini        # Changed from agno.models.google
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
+import sys
+import time
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
+# Let this file find statement_parser.py in the parent (ai_service) folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from statement_parser import parse_statement, PARSER_VERSION
+from concurrency import RateLimiter
+from agent_cache import cached_agent_json
+
+# Large statements are cleaned in line-aligned batches, several at a time
+CLEAN_BATCH_LINES = int(os.getenv("CLEAN_BATCH_LINES", "40"))
+CLEAN_MAX_WORKERS = int(os.getenv("CLEAN_MAX_WORKERS", "4"))
+CLEAN_MAX_RETRIES = int(os.getenv("CLEAN_MAX_RETRIES", "2"))
+CLEAN_CALLS_PER_MINUTE = float(os.getenv("CLEAN_CALLS_PER_MINUTE", "60"))
+
 # --- 1. MONGODB TARGET SCHEMA ---
 # This is exactly how the data will look inside your MongoDB "transactions" collection
 class MongoTransaction(BaseModel):
@@ -21,30 +37,101 @@ class TransactionList(BaseModel):
     transactions: List[MongoTransaction]
 
 # --- 2. THE AGENT ---
-cleaner_agent = Agent(
-    name="Data Cleaner",
-    model=Gemini(id="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
-    description="You are a data normalization engine for a MongoDB database.",
-    instructions=[
-        "You will receive raw transaction text strings.",
-        "Extract the merchant, amount, and payment method.",
-        "Categorize the transaction intelligently.",
-        "Detect if the transaction is 'Income' (Salary/Credit) or 'Expense'.",
-        "If the text is messy (e.g., 'UPI-4392-UBER-MUM'), clean it to 'Uber'.",
-        "Return ONLY the JSON list matching the MongoTransaction schema."
-    ],
-    response_model=TransactionList,
-    markdown=False
-)
+def build_cleaner_agent() -> Agent:
+    return Agent(
+        name="Data Cleaner",
+        model=Gemini(id="gemini-2.5-flash", api_key=os.getenv("GOOGLE_API_KEY")),
+        description="You are a data normalization engine for a MongoDB database.",
+        instructions=[
+            "You will receive raw transaction text strings.",
+            "Extract the merchant, amount, and payment method.",
+            "Categorize the transaction intelligently.",
+            "Detect if the transaction is 'Income' (Salary/Credit) or 'Expense'.",
+            "If the text is messy (e.g., 'UPI-4392-UBER-MUM'), clean it to 'Uber'.",
+            "Return ONLY the JSON list matching the MongoTransaction schema."
+        ],
+        response_model=TransactionList,
+        markdown=False
+    )
+
+# Used for the cache fingerprint. Runs never share it: phi keeps per-run state
+# (run_id, run_response, memory) on the Agent, so every worker thread gets its own.
+cleaner_agent = build_cleaner_agent()
+_thread_agents = threading.local()
+
+def _worker_agent() -> Agent:
+    agent = getattr(_thread_agents, "agent", None)
+    if agent is None:
+        agent = build_cleaner_agent()
+        _thread_agents.agent = agent
+    return agent
 
 # --- 3. API FUNCTION ---
-def clean_and_structure_data(raw_text_data: str):
+rate_limiter = RateLimiter(CLEAN_CALLS_PER_MINUTE)
+
+def _clean_with_agent(text: str) -> List[MongoTransaction]:
+    rate_limiter.wait()
+    response = _worker_agent().run(f"Clean and structure this data for MongoDB: {text}")
+    return response.content.transactions
+
+def clean_in_batches(lines: List[str], batch_lines: int = CLEAN_BATCH_LINES) -> List[MongoTransaction]:
+    """Clean `lines` in concurrent batches, keep batch order, and retry only the batches that failed."""
+    batches = ["\n".join(lines[i:i + batch_lines]) for i in range(0, len(lines), batch_lines)]
+    results: List[Optional[List[MongoTransaction]]] = [None] * len(batches)
+    pending = list(range(len(batches)))
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=CLEAN_MAX_WORKERS) as pool:
+        for attempt in range(CLEAN_MAX_RETRIES + 1):
+            if attempt:
+                time.sleep(2 ** attempt)  # Back off before retrying failed batches
+            futures = {i: pool.submit(_clean_with_agent, batches[i]) for i in pending}
+            pending = []
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    errors[i] = e
+                    pending.append(i)
+            if not pending:
+                break
+
+    if pending:
+        raise RuntimeError(
+            f"{len(pending)} of {len(batches)} cleaning batches failed: {errors[pending[0]]}"
+        )
+    return [t for batch in results for t in batch]
+
+def _clean(raw_text_data: str, batched: Optional[bool]) -> str:
+    # Fast path: regular bank/UPI lines are parsed locally
+    parsed, leftovers = parse_statement(raw_text_data)
+    transactions = [MongoTransaction(**t) for t in parsed]
+    if not parsed:
+        # Nothing recognisable, let the Agent see everything as before
+        leftovers = [line for line in raw_text_data.splitlines() if line.strip()]
+
+    # Only the lines the rules couldn't handle go to the Agent
+    if leftovers:
+        if batched is None:
+            batched = len(leftovers) > CLEAN_BATCH_LINES
+        if batched:
+            transactions.extend(clean_in_batches(leftovers))
+        else:
+            transactions.extend(_clean_with_agent("\n".join(leftovers)))
+
+    return TransactionList(transactions=transactions).model_dump_json()
+
+def clean_and_structure_data(raw_text_data: str, batched: Optional[bool] = None, use_cache: bool = True):
+    """`batched`: True/False forces the mode, None batches only when there are more lines than one batch.
+    `use_cache=False` bypasses the on-disk output cache (e.g. for a forced re-run)."""
     try:
-        # We pass the raw string to the Agent
-        response = cleaner_agent.run(f"Clean and structure this data for MongoDB: {raw_text_data}")
-        
-        # Return valid JSON string
-        return response.content.model_dump_json()
+        # Same statement again (retried upload) -> cached TransactionList JSON
+        return cached_agent_json(
+            cleaner_agent,
+            f"parser:{PARSER_VERSION}\n{raw_text_data}",
+            lambda: _clean(raw_text_data, batched),
+            use_cache=use_cache,
+        )
     except Exception as e:
         return json.dumps({"error": str(e)})
 
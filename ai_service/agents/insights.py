@@ -1,8 +1,17 @@
 from phi.agent import Agent
 from phi.model.google import Gemini
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Dict, Any
 from dotenv import load_dotenv
+import sys
+import os
+import json
+import threading
+
+# Let this file find agent_cache.py in the parent (ai_service) folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent_cache import cached_agent_json
+from services.spend_summary import summarise_transactions
 
 load_dotenv()
 
@@ -21,24 +30,60 @@ class CFOReport(BaseModel):
     summary_markdown: str = Field(..., description="A 2-paragraph executive summary formatted in Markdown.")
 
 # --- 2. THE CFO AGENT ---
-insights_agent = Agent(
-    name="FinAdapt CFO",
-    # Using the latest Gemini 3 Pro for advanced reasoning
-    model=Gemini(id="gemini-2.5-pro", temperature=0.3), 
-    description="You are a world-class Personal CFO (Chief Financial Officer).",
-    instructions=[
-        "Analyze the provided list of transactions strictly.",
-        "Identify spending patterns (e.g., too much 'Food' or 'Entertainment').",
-        "Calculate the total spend and identify the biggest category.",
-        "Generate 3 specific, actionable insights to help the user save money.",
-        "Be direct but empathetic. If they spend too much on food, suggest cooking at home.",
-        "Output the result as a structured JSON report."
-    ],
-    response_model=CFOReport,
-    markdown=True 
-)
-
-# --- 3. TEST FUNCTION ---
+def build_insights_agent() -> Agent:
+    return Agent(
+        name="FinAdapt CFO",
+        # Using the latest Gemini 3 Pro for advanced reasoning
+        model=Gemini(id="gemini-2.5-pro", temperature=0.3), 
+        description="You are a world-class Personal CFO (Chief Financial Officer).",
+        instructions=[
+            "You receive a spending summary whose totals and breakdowns were computed exactly.",
+            "Use total_spend and primary_expense_category as given; never recalculate them.",
+            "Identify spending patterns from the category, merchant and monthly breakdowns (e.g., too much 'Food' or 'Entertainment').",
+            "If you are given raw transactions instead, calculate the total spend and identify the biggest category.",
+            "Generate 3 specific, actionable insights to help the user save money.",
+            "Be direct but empathetic. If they spend too much on food, suggest cooking at home.",
+            "Output the result as a structured JSON report."
+        ],
+        response_model=CFOReport,
+        markdown=True
+    )
+
+# Used for the cache fingerprint. Runs never share it: phi keeps per-run state
+# (run_id, run_response, memory) on the Agent, so every lane thread gets its own.
+insights_agent = build_insights_agent()
+_thread_agents = threading.local()
+
+def _worker_agent() -> Agent:
+    agent = getattr(_thread_agents, "agent", None)
+    if agent is None:
+        agent = build_insights_agent()
+        _thread_agents.agent = agent
+    return agent
+
+# --- 3. API FUNCTION ---
+def generate_report(prompt: str, use_cache: bool = True) -> CFOReport:
+    """Run the CFO agent, reusing the stored report when the same data was analysed before."""
+    report_json = cached_agent_json(
+        insights_agent,
+        prompt,
+        lambda: _worker_agent().run(prompt).content.model_dump_json(),
+        use_cache=use_cache,
+    )
+    return CFOReport.model_validate_json(report_json)
+
+def analyze_transactions(transactions: List[Dict[str, Any]], use_cache: bool = True) -> CFOReport:
+    """Aggregate locally, send the agent only the compact summary, keep our exact totals."""
+    summary = summarise_transactions(transactions)
+    report = generate_report(
+        f"Analyze this spending summary: {json.dumps(summary, sort_keys=True)}",
+        use_cache=use_cache,
+    )
+    report.total_spend = summary["total_spend"]
+    report.primary_expense_category = summary["primary_expense_category"]
+    return report
+
+# --- 4. TEST FUNCTION ---
 if __name__ == "__main__":
     # We will pass the EXACT JSON output you just got from Agent 1
     sample_clean_data = """
@@ -0,0 +1,98 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Any, Dict, Optional
+
+import numpy as np
+
+# --- SEMANTIC ANSWER CACHE (Skips the LLM for near-identical questions) ---
+# An entry matches when the new query embedding is close enough to a cached one
+# AND retrieval returned the same chunks, so a changed knowledge base never
+# serves a stale answer.
+
+def chunk_key(chunk_ids: List[str]) -> str:
+    """Order-independent hash of the retrieved chunk ids."""
+    return hashlib.sha1("\x1f".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+def _normalise(vector: Any) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 512):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, query_embedding: Any, key: str) -> Optional[str]:
+        query = _normalise(query_embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_sim = None, self.threshold
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry["created_at"] > self.ttl_seconds:
+                    del self._entries[entry_id]
+                    self.evictions += 1
+                    continue
+                if entry["chunk_key"] != key:
+                    continue
+                similarity = float(np.dot(query, entry["embedding"]))
+                if similarity >= best_sim:
+                    best_id, best_sim = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"]
+
+    def store(self, query_embedding: Any, key: str, answer: str):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "embedding": _normalise(query_embedding),
+                "chunk_key": key,
+                "answer": answer,
+                "created_at": time.monotonic(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Forget every answer, e.g. after new chunks are written to the vector store."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Shared instance for the voice endpoint
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")),
+)
@@ -1,19 +1,42 @@
 import sys
 import os
-import fitz  # PyMuPDF
+import time
+import json
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from dotenv import load_dotenv
 
 # --- 1. PATH SETUP ---
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from agents.cleaner import clean_and_structure_data
-from agents.insights import insights_agent
-from agents.chatbot import chatbot
-from rag_engine import get_rag_response, VectorStore # Import VectorStore to save data
+from agents.insights import generate_report, analyze_transactions
+from agent_cache import agent_cache
+from agents.chatbot import ask_chatbot, stream_chatbot, hop_stats
+from answer_cache import answer_cache
+from context_builder import prompt_stats
+from llm_client import close_llm_clients
+from chunking import iter_chunks
+from concurrency import run_in_lane, stream_in_lane, lane_stats, shutdown_lanes, LaneTimeout, Stage, run_dag
+from pdf_text import extract_text_from_pdf, shutdown_pdf_pool
+from routes.financial_health import router as financial_health_router, financial_data_store, score_history
+from rag_engine import (  # Import VectorStore to save data
+    get_rag_response,
+    stream_rag_response,
+    VectorStore,
+    get_embedder,
+    get_embedder_metrics,
+    get_chroma_collection,
+    get_lexical_index,
+    close_chroma_clients,
+    tenant_metadata,
+    UNASSIGNED_TENANT,
+    RESERVED_TENANTS,
+    HYBRID_SEARCH,
+)
 
 load_dotenv()
 
@@ -28,15 +51,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- 3. HELPER FUNCTIONS ---
-def extract_text_from_pdf(file_bytes):
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+app.include_router(financial_health_router, prefix="/api/financial-health", tags=["Financial Health"])
+
+# --- 2b. STARTUP / SHUTDOWN (Shared models and DB handles per worker) ---
+@app.on_event("startup")
+def warm_up_models():
+    get_chroma_collection()
+    print("✅ Vector store opened.")
+    tagged = VectorStore().backfill_tenant_metadata()
+    if tagged:
+        print(f"🏷️ Tagged {tagged} pre-existing chunks with tenant metadata.")
+    if HYBRID_SEARCH:
+        VectorStore().ensure_lexical_index()
+        print(f"✅ BM25 index ready ({len(get_lexical_index())} chunks).")
+    if os.getenv("EMBEDDING_EAGER_LOAD", "true").lower() != "true":
+        return
+    print("🔥 Warming up embedding model...")
+    embedder = get_embedder()
+    embedder.warm_up()
+    print(f"✅ Embedding model ready in {embedder.load_time_ms:.0f} ms.")
 
-# --- 4. DATA MODELS ---
+@app.on_event("shutdown")
+async def release_resources():
+    close_chroma_clients()
+    await close_llm_clients()
+    shutdown_pdf_pool()
+    shutdown_lanes()
+    agent_cache.close()
+    financial_data_store.close()
+    score_history.close()
+    print("👋 Shared resources released.")
+
+# --- 3. DATA MODELS ---
 class CleanRequest(BaseModel):
     raw_text: str
 
@@ -45,6 +91,70 @@ class InsightRequest(BaseModel):
 
 class ChatRequest(BaseModel):
     query: str
+    user_id: Optional[str] = None  # Scopes retrieval to this user's uploads + shared docs
+
+# --- 4. HELPERS ---
+def check_user_id(user_id: Optional[str]):
+    """400 for the reserved tenant names: as a user id they would publish or expose other users' data."""
+    if user_id in RESERVED_TENANTS:
+        raise HTTPException(status_code=400, detail=f"'{user_id}' is reserved and can't be used as a user_id")
+
+def save_to_vector_store(raw_text: str, filename: str, tenant_id: Optional[str] = None):
+    # Anonymous uploads have no owner; they must never land in the shared knowledge base
+    tenant_id = tenant_id or UNASSIGNED_TENANT
+    db = VectorStore.for_tenant(tenant_id)
+    scope = tenant_metadata(tenant_id)
+    # Line-aware chunks with content-hash ids: re-uploads skip re-embedding. The tenant is part
+    # of the id so two users uploading the same statement each keep their own copy.
+    return db.add_chunks(
+        iter_chunks(raw_text, namespace=tenant_id),
+        lambda chunk: {"source": filename, "type": "upload", "chunk": chunk.index, **scope},
+    )
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def sse_stream(deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Forward text deltas as Server-Sent Events: `token` per piece, then `done` (with
+    time-to-first-token) or `error`."""
+    started = time.perf_counter()
+    first_token_ms = None
+    try:
+        async for delta in deltas:
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+            yield sse_event("token", {"delta": delta})
+        yield sse_event("done", {
+            "ttft_ms": first_token_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        })
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+def sse_response(deltas: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        sse_stream(deltas),
+        media_type="text/event-stream",
+        # No proxy buffering: each token should reach the client immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def extract_voice_query(data: Dict[str, Any]) -> str:
+    """The latest user utterance from a Vapi webhook payload."""
+    user_query = ""
+    
+    # 1. Check message history
+    if 'message' in data and 'messages' in data['message']:
+         messages = data['message']['messages']
+         for msg in reversed(messages):
+             if msg['role'] == 'user':
+                 user_query = msg['content']
+                 break
+    
+    # 2. Check tool arguments (Backup)
+    if not user_query and 'message' in data and 'toolCalls' in data['message']:
+         user_query = data['message']['toolCalls'][0]['function']['arguments'].get('query')
+    return user_query
 
 # --- 5. ENDPOINTS ---
 
@@ -52,107 +162,145 @@ class ChatRequest(BaseModel):
 def home():
     return {"status": "AI Service is Online 🟢"}
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "embeddings": get_embedder_metrics(),
+        "answer_cache": answer_cache.stats(),
+        "lanes": lane_stats(),
+        "agent_cache": agent_cache.stats(),
+        "lexical_index": get_lexical_index().stats(),
+        "rag_prompts": prompt_stats.stats(),
+        "chat_hops": hop_stats.stats(),
+    }
+
 # === NEW! PROCESS UPLOADED FILE (The Fix for your Loophole) ===
 @app.post("/process-document")
-async def process_document(file: UploadFile = File(...)):
+async def process_document(file: UploadFile = File(...), no_cache: bool = False, user_id: Optional[str] = None):
+    check_user_id(user_id)
     print(f"📂 Processing file: {file.filename}")
     try:
+        started = time.perf_counter()
+
         # 1. READ FILE
         file_content = await file.read()
         
         # 2. EXTRACT TEXT
         if file.filename.lower().endswith(".pdf"):
-            raw_text = extract_text_from_pdf(file_content)
+            # Off the event loop so uploads don't stall the voice webhook
+            raw_text = await run_in_lane("documents", extract_text_from_pdf, file_content)
         else:
             # Fallback for txt/csv
             raw_text = file_content.decode("utf-8")
+        extract_ms = round((time.perf_counter() - started) * 1000, 2)
 
         if not raw_text.strip():
             return {"success": False, "error": "Document appears empty."}
 
         # 3. AGENT 1: CLEAN DATA
-        print("🧹 Agent 1: Cleaning Data...")
-        clean_json_str = clean_and_structure_data(raw_text)
-        
-        # 4. AGENT 4: GENERATE INSIGHTS
-        print("🧠 Agent 4: Analyzing Finances...")
-        insights_response = insights_agent.run(f"Analyze this financial data: {clean_json_str}")
-        
-        # 5. SAVE TO VECTOR DB (So Chatbot & Voice Agent know about it)
-        print("💾 Saving to Vector Memory...")
-        try:
-            db = VectorStore()
-            # Split text into chunks (simplified)
-            chunks = [raw_text[i:i+1000] for i in range(0, len(raw_text), 1000)]
-            ids = [f"{file.filename}_chunk_{i}_{os.urandom(4).hex()}" for i in range(len(chunks))]
-            metadatas = [{"source": file.filename, "type": "upload"} for _ in chunks]
-            
-            db.add_documents(chunks, metadatas, ids)
-            print("✅ Saved to Vector Memory.")
-        except Exception as e:
-            print(f"⚠️ Vector DB Warning: {e}")
+        async def clean(raw_text):
+            print("🧹 Agent 1: Cleaning Data...")
+            return await run_in_lane("clean", clean_and_structure_data, raw_text, use_cache=not no_cache)
+
+        # 4. AGENT 4: GENERATE INSIGHTS (needs the cleaned data)
+        async def insights(clean):
+            print("🧠 Agent 4: Analyzing Finances...")
+            cleaned = json.loads(clean)
+            if "transactions" in cleaned:
+                # Totals are aggregated locally; the agent only sees the summary
+                return await run_in_lane("insights", analyze_transactions, cleaned["transactions"], use_cache=not no_cache)
+            return await run_in_lane("insights", generate_report, f"Analyze this financial data: {clean}", use_cache=not no_cache)
+
+        # 5. SAVE TO VECTOR DB (only needs raw text, so it runs alongside the agents)
+        async def vector_store(raw_text):
+            print("💾 Saving to Vector Memory...")
+            try:
+                stats = await run_in_lane("documents", save_to_vector_store, raw_text, file.filename, user_id)
+                print(f"✅ Saved to Vector Memory ({stats['added']} new, {stats['skipped']} already stored).")
+                return stats
+            except Exception as e:
+                print(f"⚠️ Vector DB Warning: {e}")
+                return {"error": str(e)}
+
+        results, timings = await run_dag(
+            [
+                Stage("clean", clean, ["raw_text"]),
+                Stage("insights", insights, ["clean"]),
+                Stage("vector_store", vector_store, ["raw_text"]),
+            ],
+            initial={"raw_text": raw_text},
+        )
 
         # 6. RETURN RESULTS TO DASHBOARD
         return {
             "success": True,
             "filename": file.filename,
-            "clean_data": clean_json_str,
-            "report": insights_response.content
+            "clean_data": results["clean"],
+            "report": results["insights"],
+            "timings_ms": {
+                "extract": extract_ms,
+                **timings,
+                "total": round((time.perf_counter() - started) * 1000, 2),
+            }
         }
 
+    except LaneTimeout as e:
+        print(f"⏱️ Timeout processing document: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"❌ Error processing document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # === AGENT 1: DIRECT CLEANER (Legacy) ===
 @app.post("/clean")
-def clean_data(request: CleanRequest):
+async def clean_data(request: CleanRequest, no_cache: bool = False):
     try:
-        result = clean_and_structure_data(request.raw_text)
+        result = await run_in_lane("clean", clean_and_structure_data, request.raw_text, use_cache=not no_cache)
         return {"success": True, "data": result}
+    except LaneTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === AGENT 4: DIRECT INSIGHTS (Legacy) ===
 @app.post("/insights")
-def generate_insights(request: InsightRequest):
+async def generate_insights(request: InsightRequest, no_cache: bool = False):
     try:
-        transaction_str = str(request.transactions)
-        response = insights_agent.run(f"Analyze this data: {transaction_str}")
-        return {"success": True, "report": response.content}
+        report = await run_in_lane("insights", analyze_transactions, request.transactions, use_cache=not no_cache)
+        return {"success": True, "report": report}
+    except LaneTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === AGENT 5: TEXT CHATBOT ===
 @app.post("/chat")
-def chat_with_rag(request: ChatRequest):
+async def chat_with_rag(request: ChatRequest):
+    check_user_id(request.user_id)
     try:
-        # Uses the Agent (which uses rag_engine internally)
-        response = chatbot.run(request.query)
-        return {"success": True, "answer": response.content}
+        # Simple lookups: one Groq RAG answer. Everything else: the Agent, with rag_engine as its tool
+        result = await run_in_lane("chat", ask_chatbot, request.query, user_id=request.user_id)
+        return {"success": True, **result}
+    except LaneTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def stream_chat_with_rag(request: ChatRequest):
+    """/chat as Server-Sent Events: tokens are forwarded as the model produces them."""
+    check_user_id(request.user_id)
+    return sse_response(stream_in_lane("chat", stream_chatbot, request.query, user_id=request.user_id))
+
 # === AGENT 6: VOICE KNOWLEDGE SEARCH (Vapi) ===
 @app.post("/api/knowledge-search")
-async def handle_knowledge_request(request: Request):
+async def handle_knowledge_request(request: Request, user_id: Optional[str] = None):
+    check_user_id(user_id)
     try:
         data = await request.json()
         print("📞 Vapi called Knowledge Service")
         
-        user_query = ""
-        
-        # 1. Check message history
-        if 'message' in data and 'messages' in data['message']:
-             messages = data['message']['messages']
-             for msg in reversed(messages):
-                 if msg['role'] == 'user':
-                     user_query = msg['content']
-                     break
-        
-        # 2. Check tool arguments (Backup)
-        if not user_query and 'message' in data and 'toolCalls' in data['message']:
-             user_query = data['message']['toolCalls'][0]['function']['arguments'].get('query')
+        user_query = extract_voice_query(data)
 
         if not user_query:
             return {"response": {"result": "I'm listening, but I didn't hear a question.", "is_successful": False}}
@@ -160,7 +308,7 @@ async def handle_knowledge_request(request: Request):
         print(f"🗣️ Voice Query: {user_query}")
         
         # CALL THE BRAIN (Your Vector DB)
-        retrieved_context = get_rag_response(user_query)
+        retrieved_context = await run_in_lane("knowledge", get_rag_response, user_query, use_cache=True, tenant_id=user_id)
         
         # Send answer back to Vapi
         return {
@@ -174,4 +322,19 @@ async def handle_knowledge_request(request: Request):
         print(f"❌ Error in knowledge search: {e}")
         return {"response": {"result": "My financial brain is offline momentarily.", "is_successful": False}}
 
+@app.post("/api/knowledge-search/stream")
+async def stream_knowledge_request(request: Request, user_id: Optional[str] = None):
+    """Knowledge search as Server-Sent Events, so speech can start on the first tokens."""
+    check_user_id(user_id)
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    user_query = extract_voice_query(data)
+    if not user_query:
+        raise HTTPException(status_code=400, detail="I'm listening, but I didn't hear a question.")
+
+    print(f"🗣️ Voice Query (streaming): {user_query}")
+    return sse_response(stream_in_lane("knowledge", stream_rag_response, user_query, use_cache=True, tenant_id=user_id))
+
 # Run with: uvicorn app:app --reload --port 8000
\ No newline at end of file
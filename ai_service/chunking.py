@@ -0,0 +1,84 @@
+import os
+import hashlib
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple
+
+# --- STRUCTURE-AWARE CHUNKER (Shared by ingest.py and /process-document) ---
+# Splits on line boundaries so a statement/transaction row is never cut in half,
+# carries `overlap` characters of trailing lines into the next chunk, and ids are
+# content hashes so the same text always maps to the same chunk.
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+@dataclass
+class Chunk:
+    id: str
+    text: str
+    index: int
+    page: int  # page (0-based) where the chunk starts
+
+def chunk_id(text: str, namespace: str = "") -> str:
+    digest = hashlib.sha256(f"{namespace}\x1f{text}".encode("utf-8")).hexdigest()
+    return f"chunk_{digest[:32]}"
+
+def _iter_lines(pages: Iterable[str], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, str]]:
+    """(page, line) pairs; long lines are hard-split so no unit exceeds `chunk_size`."""
+    for page_no, page_text in enumerate(pages):
+        for line in page_text.splitlines(keepends=True):
+            if not line.strip():
+                continue
+            if not line.endswith("\n"):
+                line += "\n"
+            while len(line) > chunk_size:
+                yield page_no, line[:chunk_size]
+                line = line[chunk_size:]
+            if line.strip():  # The split can leave just the newline, which would be an empty chunk
+                yield page_no, line
+
+def iter_chunks(
+    pages: Iterable[str],
+    namespace: str = "",
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> Iterator[Chunk]:
+    """Lazily chunk a stream of page texts (a plain string counts as one page).
+
+    Only the current window of lines is held in memory, so a multi-hundred-page
+    statement streamed from ``pdf_text.iter_pdf_pages`` is never materialised.
+    """
+    if isinstance(pages, str):
+        pages = [pages]
+
+    window: List[Tuple[int, str]] = []
+    window_len = 0
+    index = 0
+    fresh = False  # does the window hold lines not yet emitted?
+
+    def emit() -> Chunk:
+        text = "".join(line for _, line in window).strip()
+        return Chunk(id=chunk_id(text, namespace), text=text, index=index, page=window[0][0])
+
+    for page_no, line in _iter_lines(pages, chunk_size):
+        if window and fresh and window_len + len(line) > chunk_size:
+            yield emit()
+            index += 1
+            # Keep whole trailing lines (up to `overlap` chars) as context for the next chunk
+            carried: List[Tuple[int, str]] = []
+            carried_len = 0
+            for item in reversed(window):
+                if carried_len + len(item[1]) > overlap:
+                    break
+                carried.insert(0, item)
+                carried_len += len(item[1])
+            window, window_len = carried, carried_len
+            fresh = False
+        # Overlap lines plus this one might still be too long; drop context first
+        while window and window_len + len(line) > chunk_size:
+            window_len -= len(window.pop(0)[1])
+        window.append((page_no, line))
+        window_len += len(line)
+        fresh = True
+
+    if window and fresh:
+        yield emit()
@@ -0,0 +1,195 @@
+import os
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# --- BOUNDED EXECUTION LANES (Keep slow LLM calls off the event loop) ---
+# Each endpoint gets its own small thread pool, so a burst of /clean uploads can
+# fill its own lane but never take the threads the voice webhook needs.
+# Override per lane with LANE_<NAME>_WORKERS / LANE_<NAME>_TIMEOUT.
+
+DEFAULT_LANES = {
+    # name: (max concurrent calls, timeout seconds)
+    "knowledge": (8, 20.0),
+    "chat": (4, 60.0),
+    "clean": (4, 120.0),
+    "insights": (4, 120.0),
+    "documents": (2, 300.0),
+}
+
+class LaneTimeout(Exception):
+    pass
+
+class Lane:
+    def __init__(self, name: str, max_workers: int, timeout: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"lane-{name}")
+        self.in_flight = 0
+        self.timeouts = 0
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run a blocking call in this lane. The timeout includes time spent queued."""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            future = loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            # The worker thread can't be interrupted; on timeout it finishes in the background
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LaneTimeout(f"'{self.name}' call timed out after {timeout or self.timeout:.0f}s")
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, fn: Callable[..., Iterator[Any]], *args, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+        """Iterate a blocking generator in this lane, yielding its items as they arrive.
+
+        The timeout bounds the wait for each item (so first token and any stall),
+        not the whole stream. Closing the async iterator stops the generator.
+        """
+        loop = asyncio.get_running_loop()
+        items: "asyncio.Queue" = asyncio.Queue()
+        stop = threading.Event()
+        _done = object()
+        wait = timeout or self.timeout
+
+        def produce():
+            try:
+                generator = fn(*args, **kwargs)
+                try:
+                    for item in generator:
+                        if stop.is_set():
+                            break
+                        loop.call_soon_threadsafe(items.put_nowait, item)
+                finally:
+                    close = getattr(generator, "close", None)
+                    if close:
+                        close()
+                loop.call_soon_threadsafe(items.put_nowait, _done)
+            except BaseException as e:
+                loop.call_soon_threadsafe(items.put_nowait, e)
+
+        self.in_flight += 1
+        future = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(items.get(), wait)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise LaneTimeout(f"'{self.name}' stream stalled for {wait:.0f}s")
+                if item is _done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            self.in_flight -= 1
+            future.add_done_callback(lambda f: f.exception())  # Never "exception was never retrieved"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "timeouts": self.timeouts,
+        }
+
+_lanes: Dict[str, Lane] = {}
+_lanes_lock = threading.Lock()
+
+def get_lane(name: str) -> Lane:
+    lane = _lanes.get(name)
+    if lane is None:
+        with _lanes_lock:
+            lane = _lanes.get(name)
+            if lane is None:
+                workers, timeout = DEFAULT_LANES.get(name, (4, 60.0))
+                lane = Lane(
+                    name,
+                    max_workers=int(os.getenv(f"LANE_{name.upper()}_WORKERS", workers)),
+                    timeout=float(os.getenv(f"LANE_{name.upper()}_TIMEOUT", timeout)),
+                )
+                _lanes[name] = lane
+    return lane
+
+async def run_in_lane(name: str, fn: Callable, *args, **kwargs) -> Any:
+    return await get_lane(name).run(fn, *args, **kwargs)
+
+def stream_in_lane(name: str, fn: Callable[..., Iterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+    return get_lane(name).stream(fn, *args, **kwargs)
+
+def lane_stats() -> Dict[str, Any]:
+    return {name: lane.stats() for name, lane in _lanes.items()}
+
+def shutdown_lanes():
+    with _lanes_lock:
+        for lane in _lanes.values():
+            lane.executor.shutdown(wait=False, cancel_futures=True)
+        _lanes.clear()
+
+# --- RATE LIMITER (Thread-safe, spaces calls to stay under provider quotas) ---
+class RateLimiter:
+    def __init__(self, calls_per_minute: float):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the caller may make its next call."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+# --- STAGE DAG (Run independent pipeline steps concurrently) ---
+class Stage:
+    """A named async step. `fn` receives the results of `deps` as keyword arguments."""
+    def __init__(self, name: str, fn: Callable[..., Awaitable[Any]], deps: Optional[List[str]] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = deps or []
+
+async def run_dag(stages: List[Stage], initial: Optional[Dict[str, Any]] = None):
+    """Start every stage as soon as its dependencies finish.
+
+    Returns ``(results, timings_ms)``; timings hold each stage's own run time,
+    excluding time spent waiting for its inputs. The first failure cancels the rest.
+    """
+    results: Dict[str, Any] = dict(initial or {})
+    timings: Dict[str, float] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_stage(stage: Stage):
+        for dep in stage.deps:
+            if dep not in results:
+                await tasks[dep]
+        start = time.perf_counter()
+        try:
+            results[stage.name] = await stage.fn(**{dep: results[dep] for dep in stage.deps})
+        finally:
+            timings[stage.name] = round((time.perf_counter() - start) * 1000, 2)
+
+    for stage in stages:
+        unknown = [dep for dep in stage.deps if dep not in results and dep not in {s.name for s in stages}]
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages {unknown}")
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return results, timings
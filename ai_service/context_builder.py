@@ -0,0 +1,153 @@
+import os
+import re
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# --- CONTEXT BUILDER (Token-budgeted RAG context) ---
+# Retrieved chunks overlap by design (CHUNK_OVERLAP) and fused lists can repeat
+# text, so we dedupe line by line, keep the best-ranked chunks first and stop
+# at a token budget. Counts come from tiktoken (cl100k_base, close to Llama 3's
+# BPE) when installed, otherwise from a 4-chars-per-token estimate.
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "900"))
+MIN_PARTIAL_TOKENS = 32  # Don't bother appending a sliver of a chunk
+MIN_DEDUPE_LINE = 12  # Short lines ("Total", "UPI") legitimately repeat
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # Not installed, or no cached BPE file offline
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+def tokenizer_name() -> str:
+    return "tiktoken:cl100k_base" if _encoding is not None else "estimate:4chars"
+
+def _clean_lines(text: str) -> List[str]:
+    """Non-empty lines with runs of whitespace collapsed, so overlap dedupes on content."""
+    lines = (re.sub(r"\s+", " ", line).strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    chunk_ids: List[str] = field(default_factory=list)
+    tokens: int = 0
+    candidates: int = 0
+    dropped: int = 0  # Chunks left out (fully duplicate or over budget)
+    truncated: bool = False
+
+
+def build_context(hits: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  separator: str = "\n\n") -> BuiltContext:
+    """Best-first, deduped context from retrieval hits ({id, text, score?}) within `token_budget`."""
+    ranked = sorted(hits, key=lambda h: -(h.get("score") or 0.0))  # stable: keeps fused order on ties
+    seen_lines = set()
+    parts: List[str] = []
+    built = BuiltContext(text="", candidates=len(hits))
+    separator_tokens = count_tokens(separator)
+
+    for hit in ranked:
+        lines = []
+        for line in _clean_lines(hit.get("text") or ""):
+            key = line.lower()
+            if len(line) >= MIN_DEDUPE_LINE:
+                if key in seen_lines:
+                    continue  # Overlap with a chunk we already kept
+                seen_lines.add(key)
+            lines.append(line)
+        if not lines:
+            continue
+
+        remaining = token_budget - built.tokens - (separator_tokens if parts else 0)
+        text = "\n".join(lines)
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            # Keep whole lines from the top of the chunk while they fit
+            kept, used = [], 0
+            for line in lines:
+                line_tokens = count_tokens(line + "\n")
+                if used + line_tokens > remaining:
+                    break
+                kept.append(line)
+                used += line_tokens
+            if used < MIN_PARTIAL_TOKENS:
+                break
+            text, tokens = "\n".join(kept), count_tokens("\n".join(kept))
+            built.truncated = True
+
+        if parts:
+            built.tokens += separator_tokens
+        parts.append(text)
+        built.chunk_ids.append(hit["id"])
+        built.tokens += tokens
+        if built.truncated:
+            break
+
+    built.dropped = len(ranked) - len(built.chunk_ids)
+    built.text = separator.join(parts)
+    return built
+
+
+# --- PROMPT TOKEN STATS (served on /metrics) ---
+class PromptStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.total_prompt_tokens = 0
+        self.total_context_tokens = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    def record(self, prompt_tokens: int, context: BuiltContext):
+        with self._lock:
+            self.prompts += 1
+            self.total_prompt_tokens += prompt_tokens
+            self.total_context_tokens += context.tokens
+            self.last = {
+                "prompt_tokens": prompt_tokens,
+                "context_tokens": context.tokens,
+                "chunks": len(context.chunk_ids),
+                "candidates": context.candidates,
+                "dropped": context.dropped,
+                "truncated": context.truncated,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokenizer": tokenizer_name(),
+                "token_budget": CONTEXT_TOKEN_BUDGET,
+                "prompts": self.prompts,
+                "avg_prompt_tokens": round(self.total_prompt_tokens / self.prompts, 1) if self.prompts else None,
+                "avg_context_tokens": round(self.total_context_tokens / self.prompts, 1) if self.prompts else None,
+                "last": self.last,
+            }
+
+prompt_stats = PromptStats()
+
+
+# --- TEST ---
+if __name__ == "__main__":
+    lines = [f"2024-11-{d:02d} | UPI/{d}/SWIGGY ORDER | -{d * 10}.00" for d in range(1, 40)]
+    first, second = "\n".join(lines[:24]), "\n".join(lines[19:])  # Whole-line overlap, like iter_chunks
+    hits = [
+        {"id": "b", "text": second, "score": 0.03},
+        {"id": "a", "text": first, "score": 0.05},
+        {"id": "dup", "text": first, "score": 0.01},
+    ]
+    built = build_context(hits, token_budget=10_000)
+    assert built.chunk_ids == ["a", "b"] and built.dropped == 1, built
+    assert built.text.count("UPI/20/SWIGGY") <= 1
+    small = build_context(hits, token_budget=120)
+    assert small.tokens <= 120 and small.truncated, small
+    print(f"✅ Context builder ({tokenizer_name()}): {count_tokens(first + second)} raw tokens -> "
+          f"{built.tokens} deduped, {small.tokens} under a 120-token budget.")
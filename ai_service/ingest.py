@@ -1,40 +1,129 @@
 import os
-import uuid
-from langchain_community.document_loaders import PyMuPDFLoader, DirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from rag_engine import VectorStore # Import from the file we just made
+import glob
+import json
+import hashlib
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from chunking import Chunk, iter_chunks
+from pdf_text import iter_pdf_pages
+from rag_engine import SHARED_TENANT, EmbedPool, VectorStore, tenant_metadata # Import from the file we just made
 
 # SETUP PATHS
 PDF_FOLDER = "./data_source" # Put your .pdf files here
+MANIFEST_PATH = "./rag_data/ingest_manifest.json" # What has already been ingested
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+
+# --- MANIFEST (path -> mtime, size, content hash, chunk ids) ---
+def load_manifest() -> Dict[str, Any]:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: Dict[str, Any]):
+    # Write-then-rename so a crash never leaves a half-written manifest
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _tracked(chunks: Iterable[Chunk], seen: List[str]) -> Iterator[Chunk]:
+    for chunk in chunks:
+        seen.append(chunk.id)
+        yield chunk
+
+def _legacy_ids(db: VectorStore, path: str) -> List[str]:
+    """Chunks of this file stored before the manifest (random uuid4 ids), found by their `source`.
+    Older runs recorded the loader's path, sometimes with Windows separators."""
+    sources = {path, os.path.normpath(path)}
+    sources |= {s.replace("/", "\\") for s in sources} | {s.replace("\\", "/") for s in sources}
+    return db.ids_where({"$and": [
+        {"source": {"$in": sorted(sources)}},
+        {"tenant_id": SHARED_TENANT},  # Never touch user uploads that happen to share a file name
+    ]})
+
+# --- INGESTION ---
+def ingest_file(db: VectorStore, path: str, source: str, entry: Dict[str, Any],
+                pool: Optional[EmbedPool] = None) -> Dict[str, Any]:
+    """Stream one PDF into the store. `entry` keeps the previous chunk ids until we finish."""
+    # A file the manifest has never recorded may still have chunks from before it existed
+    previous_ids = entry["chunk_ids"] if "chunk_ids" in entry else _legacy_ids(db, path)
+    new_ids: List[str] = []
+    scope = tenant_metadata()  # Knowledge-base PDFs are shared with every user
+    stats = db.add_chunks(
+        _tracked(iter_chunks(iter_pdf_pages(path), namespace=source), new_ids),
+        lambda chunk: {"source": path, "page": chunk.page, "chunk": chunk.index, **scope},
+        batch_size=BATCH_SIZE,
+        pool=pool,
+    )
+    stale_ids = sorted(set(previous_ids) - set(new_ids))
+    db.delete(stale_ids)
+    stats["deleted"] = len(stale_ids)
+    entry["chunk_ids"] = list(dict.fromkeys(new_ids))
+    entry["complete"] = True
+    return stats
 
 def ingest_data():
     print(f"🔄 Scanning {PDF_FOLDER} for PDFs...")
-    
-    # 1. Load PDFs
+
+    # 1. Find PDFs
     if not os.path.exists(PDF_FOLDER):
         os.makedirs(PDF_FOLDER)
         print(f"⚠️ Created folder {PDF_FOLDER}. Please put PDF files there and run this again.")
         return
 
-    loader = DirectoryLoader(PDF_FOLDER, glob="**/*.pdf", loader_cls=PyMuPDFLoader)
-    raw_docs = loader.load()
-    print(f"✅ Loaded {len(raw_docs)} pages.")
+    pdf_paths = sorted(glob.glob(os.path.join(PDF_FOLDER, "**", "*.pdf"), recursive=True))
+    print(f"✅ Found {len(pdf_paths)} PDFs.")
 
-    # 2. Split Text
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(raw_docs)
-    print(f"✂️ Split into {len(chunks)} chunks.")
-
-    # 3. Save to Vector DB
     db = VectorStore()
-    
-    docs_text = [chunk.page_content for chunk in chunks]
-    metadatas = [chunk.metadata for chunk in chunks]
-    ids = [str(uuid.uuid4()) for _ in chunks]
+    tagged = db.backfill_tenant_metadata()
+    if tagged:
+        print(f"🏷️ Tagged {tagged} chunks stored before tenant scoping.")
+    manifest = load_manifest()
+    current_sources = set()
+
+    # 2. New / changed files: stream pages -> chunks -> ChromaDB in batches.
+    # One encoder pool for the whole run; it only starts once the run is big enough
+    with EmbedPool() as pool:
+        for path in pdf_paths:
+            source = os.path.relpath(path, PDF_FOLDER)
+            current_sources.add(source)
+            stat = os.stat(path)
+            entry = manifest.get(source, {})
+
+            if entry.get("complete") and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+                continue
+            sha = file_sha256(path)
+            if entry.get("complete") and entry.get("sha256") == sha:
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                save_manifest(manifest)
+                continue
+
+            # Mark as in-progress first: an interrupted run picks this file up again, and
+            # stable chunk ids mean batches already written are skipped, not re-embedded
+            entry.update(mtime=stat.st_mtime, size=stat.st_size, sha256=sha, complete=False)
+            manifest[source] = entry
+            save_manifest(manifest)
+
+            stats = ingest_file(db, path, source, entry, pool)
+            save_manifest(manifest)
+            print(f"✂️ {source}: {stats['added']} new, {stats['skipped']} unchanged, {stats['deleted']} removed chunks.")
+
+    # 3. Files that disappeared: drop their chunks
+    for source in sorted(set(manifest) - current_sources):
+        db.delete(manifest[source].get("chunk_ids", []))
+        del manifest[source]
+        save_manifest(manifest)
+        print(f"🗑️ {source}: removed from vector store.")
 
-    print("💾 Saving to ChromaDB (this might take a moment)...")
-    db.add_documents(docs_text, metadatas, ids)
     print("🚀 Ingestion Complete! RAG is ready.")
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    ingest_data()
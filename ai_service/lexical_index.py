@@ -0,0 +1,159 @@
+import math
+import re
+import time
+import heapq
+import threading
+from collections import Counter
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple
+
+# --- BM25 INDEX (Exact-token retrieval next to the dense vectors) ---
+# MiniLM embeddings blur exact tokens that matter in finance: merchant names,
+# "NEFT", "80C", amounts. This in-process inverted index scores chunks with
+# Okapi BM25 and is fused with the Chroma results. It is built from the
+# collection on first use and updated incrementally on every add/delete in this
+# process; writes by other processes are picked up by a periodic background
+# rebuild. Each doc remembers its tenant so scoped searches only score that
+# tenant's (and shared) chunks.
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+REBUILD_PAGE_SIZE = 1000
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "should the this to was what when where which who why will with you your".split()
+)
+# Words, section numbers like "80c", amounts like "1,50,000.00"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        token = token.replace(",", "")
+        if token.endswith(".00"):
+            token = token[:-3]  # "50000.00" and "50,000" are the same amount
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {doc id: term frequency}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}  # doc id -> distinct terms, for removal
+        self._doc_len: Dict[str, int] = {}
+        self._doc_tenant: Dict[str, Optional[str]] = {}
+        self._total_len = 0
+        self.built = False
+        self.checked_at = 0.0  # monotonic time the owner last compared us with the store
+        self.refreshing = False  # a background rebuild is running
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def _add_one(self, doc_id: str, text: str, tenant: Optional[str] = None):
+        if doc_id in self._doc_len:
+            self._remove_one(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(counts)
+        self._doc_tenant[doc_id] = tenant
+        length = sum(counts.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def _remove_one(self, doc_id: str):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        self._doc_tenant.pop(doc_id, None)
+
+    def add(self, ids: List[str], texts: List[str], tenants: Optional[List[Optional[str]]] = None):
+        with self._lock:
+            for i, (doc_id, text) in enumerate(zip(ids, texts)):
+                self._add_one(doc_id, text, tenants[i] if tenants else None)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+    def rebuild(self, pages: Iterable[Tuple[List[str], List[str], Optional[List[Optional[str]]]]]):
+        """Replace the index with (ids, texts, tenants) pages, e.g. read back from Chroma.
+        The new postings are built aside; searches use the old ones until the swap."""
+        fresh = BM25Index(self.k1, self.b)
+        for ids, texts, tenants in pages:
+            fresh.add(ids, texts, tenants)
+        with self._lock:
+            self._postings, self._doc_terms = fresh._postings, fresh._doc_terms
+            self._doc_len, self._doc_tenant, self._total_len = fresh._doc_len, fresh._doc_tenant, fresh._total_len
+            self.built = True
+
+    def claim_check(self, interval: float) -> bool:
+        """True for at most one caller per `interval` seconds, and never while a rebuild runs."""
+        now = time.monotonic()
+        with self._lock:
+            if self.refreshing or now - self.checked_at < interval:
+                return False
+            self.checked_at = now
+            return True
+
+    def search(self, query: str, top_k: int = 5, tenants: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """[(doc id, BM25 score)], best first; only docs sharing a term with the query
+        (and, when `tenants` is given, belonging to one of them)."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not terms or not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    if tenants is not None and self._doc_tenant.get(doc_id) not in tenants:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"built": self.built, "refreshing": self.refreshing,
+                    "documents": len(self._doc_len), "terms": len(self._postings)}
+
+
+# --- TEST (Exact tokens beat paraphrase) ---
+if __name__ == "__main__":
+    index = BM25Index()
+    index.rebuild([(
+        ["a", "b", "c", "d"],
+        [
+            "Section 80C allows a deduction of up to Rs 1,50,000 for ELSS, PPF and life insurance.",
+            "NEFT transfers settle in half-hourly batches; IMPS is instant.",
+            "Build an emergency fund covering six months of expenses before investing.",
+            "Paid 50,000.00 to ACME via NEFT on 21/11/2024.",
+        ],
+        ["shared", "shared", "shared", "user-1"],
+    )])
+    assert tokenize("₹1,50,000.00 under 80C") == ["150000", "under", "80c"]
+    assert index.search("80c limit")[0][0] == "a"
+    assert [doc for doc, _ in index.search("neft 50000")][:2] == ["d", "b"]
+    assert [doc for doc, _ in index.search("neft 50000", tenants={"shared", "user-2"})] == ["b"]
+    index.remove(["d"])
+    assert index.search("acme") == []
+    index.add(["d"], ["ACME refund"])
+    assert index.search("acme")[0][0] == "d"
+    print("✅ BM25 index:", index.stats())
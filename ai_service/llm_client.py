@@ -0,0 +1,96 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+from langchain_groq import ChatGroq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- 1. SETTINGS (Override via env, e.g. GROQ_BASE_URL=http://localhost:9000 for a local stub) ---
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
+GROQ_TEMPERATURE = float(os.getenv("GROQ_TEMPERATURE", "0.1"))
+GROQ_TIMEOUT_SECONDS = float(os.getenv("GROQ_TIMEOUT_SECONDS", "30"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")  # None -> Groq cloud
+
+# --- 2. SHARED HTTP POOLS (Keep-alive connections reused across requests) ---
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_llms: Dict[tuple, ChatGroq] = {}
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+    )
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=GROQ_TIMEOUT_SECONDS)
+        return _http_client
+
+def get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=GROQ_TIMEOUT_SECONDS)
+        return _async_http_client
+
+# --- 3. CHATGROQ POOL (One client per model/temperature) ---
+def get_groq_llm(model_name: Optional[str] = None, temperature: Optional[float] = None) -> ChatGroq:
+    model_name = model_name or GROQ_MODEL
+    temperature = GROQ_TEMPERATURE if temperature is None else temperature
+    key = (model_name, temperature)
+    llm = _llms.get(key)
+    if llm is not None:
+        return llm
+
+    http_client = get_http_client()
+    async_http_client = get_async_http_client()
+    with _lock:
+        llm = _llms.get(key)
+        if llm is None:
+            kwargs = {}
+            if GROQ_BASE_URL:
+                kwargs["groq_api_base"] = GROQ_BASE_URL
+            llm = ChatGroq(
+                groq_api_key=os.getenv("GROQ_API_KEY"),
+                model_name=model_name,
+                temperature=temperature,
+                request_timeout=GROQ_TIMEOUT_SECONDS,
+                max_retries=GROQ_MAX_RETRIES,
+                http_client=http_client,
+                http_async_client=async_http_client,
+                **kwargs
+            )
+            _llms[key] = llm
+        return llm
+
+def groq_client_kwargs() -> dict:
+    """Connection settings for agno/phi Groq models so agents share the same pool."""
+    kwargs = {
+        "timeout": GROQ_TIMEOUT_SECONDS,
+        "max_retries": GROQ_MAX_RETRIES,
+        "http_client": get_http_client(),
+    }
+    if GROQ_BASE_URL:
+        kwargs["base_url"] = GROQ_BASE_URL
+    return kwargs
+
+async def close_llm_clients():
+    """Close pooled connections. Call on app shutdown or between benchmark runs."""
+    global _http_client, _async_http_client
+    with _lock:
+        _llms.clear()
+        http_client, _http_client = _http_client, None
+        async_http_client, _async_http_client = _async_http_client, None
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
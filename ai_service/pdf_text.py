@@ -0,0 +1,77 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+
+# --- PDF TEXT EXTRACTION (Page streaming + process pool for big statements) ---
+# `source` is either the raw file bytes (uploads) or a path on disk (ingest.py).
+PdfSource = Union[bytes, str]
+
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "100"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _open(source: PdfSource):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _extract_page_range(task: Tuple[str, int, int]) -> List[str]:
+    """Process-pool worker: text of pages [start, end) of the PDF at `path`."""
+    path, start, end = task
+    with _open(path) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs threads (FastAPI lanes) can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=PDF_MAX_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+def shutdown_pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def iter_pdf_pages(source: PdfSource) -> Iterator[str]:
+    """Yield page text in order. Large documents are split across the process pool."""
+    with _open(source) as doc:
+        page_count = doc.page_count
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_MAX_WORKERS <= 1:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    # Tasks carry a path, not the document: uploaded bytes are written to disk once
+    # instead of being pickled into every page-range task
+    temp_path = None
+    if isinstance(source, (bytes, bytearray)):
+        fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+    path = temp_path or source
+    try:
+        tasks = [
+            (path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        # map() keeps page order and only holds finished batches in memory
+        for pages in _get_pool().map(_extract_page_range, tasks):
+            yield from pages
+    finally:
+        if temp_path is not None:
+            os.remove(temp_path)
+
+def extract_text_from_pdf(source: PdfSource) -> str:
+    return "".join(iter_pdf_pages(source))
@@ -1,94 +1,614 @@
 import os
+import re
+import time
+import hashlib
+import threading
+import queue
+import numpy as np
 import chromadb
 import logging
-from typing import List, Any
+from typing import List, Any, Dict, Iterable, Iterator, Callable, Optional, Set, Union
 from sentence_transformers import SentenceTransformer
-from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+from answer_cache import answer_cache, chunk_key
+from llm_client import get_groq_llm
+from chunking import Chunk
+from lexical_index import BM25Index, REBUILD_PAGE_SIZE
+from context_builder import build_context, count_tokens, prompt_stats
 
 load_dotenv()
 
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MULTIPROCESS_MIN_DOCS = int(os.getenv("EMBED_MULTIPROCESS_MIN_DOCS", "5000"))
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "0"))  # 0 -> one per CPU core
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))  # per ranked list, before fusion
+LEXICAL_REFRESH_SECONDS = float(os.getenv("LEXICAL_REFRESH_SECONDS", "30"))  # how often to look for other processes' writes
+TENANT_COLLECTIONS = os.getenv("TENANT_COLLECTIONS", "false").lower() == "true"  # one collection per user
+
 # --- 1. EMBEDDING MANAGER (Handles Text-to-Numbers) ---
 class EmbeddingManager:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        start = time.perf_counter()
         self.model = SentenceTransformer(model_name)
-        
+        self.model_name = model_name
+        self.load_time_ms = (time.perf_counter() - start) * 1000
+        self._stats_lock = threading.Lock()
+        self._encode_calls = 0
+        self._encode_total_ms = 0.0
+        self._encode_last_ms = 0.0
+
+    def _record(self, start: float):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._encode_calls += 1
+            self._encode_total_ms += elapsed_ms
+            self._encode_last_ms = elapsed_ms
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        start = time.perf_counter()
+        vectors = self.model.encode(texts, convert_to_numpy=True).astype(np.float32, copy=False)
+        self._record(start)
+        return vectors
+
+    def encode_array(self, texts: List[str], pool: Any = None) -> np.ndarray:
+        """float32 matrix for bulk writes; with a pool from start_pool() the batch is split across processes."""
+        if pool is None:
+            return self._encode(texts)
+        start = time.perf_counter()
+        vectors = self.model.encode_multi_process(texts, pool, batch_size=EMBED_BATCH_SIZE)
+        self._record(start)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def start_pool(self):
+        target_devices = ["cpu"] * EMBED_PROCESSES if EMBED_PROCESSES > 0 else None
+        return self.model.start_multi_process_pool(target_devices=target_devices)
+
+    def stop_pool(self, pool: Any):
+        self.model.stop_multi_process_pool(pool)
+
     def get_embeddings(self, texts: List[str]) -> Any:
-        return self.model.encode(texts, convert_to_numpy=True).tolist()
+        return self._encode(texts).tolist()
 
     def embed_query(self, text: str) -> Any:
-        return self.model.encode([text], convert_to_numpy=True).tolist()[0]
+        return self._encode([text]).tolist()[0]
+
+    def embed_queries(self, texts: List[str]) -> Any:
+        """Encode several queries in one forward pass."""
+        return self._encode(texts).tolist()
+
+    def warm_up(self):
+        """Run one throwaway encode so the first real request doesn't pay for lazy init."""
+        self._encode(["FinAdapt warm-up"])
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            calls = self._encode_calls
+            return {
+                "model": self.model_name,
+                "loaded": True,
+                "load_time_ms": round(self.load_time_ms, 2),
+                "encode_calls": calls,
+                "encode_avg_ms": round(self._encode_total_ms / calls, 2) if calls else 0.0,
+                "encode_last_ms": round(self._encode_last_ms, 2),
+            }
+
+# One model per worker process, shared by every request
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder() -> EmbeddingManager:
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = EmbeddingManager()
+    return _embedder
+
+def get_embedder_metrics() -> Dict[str, Any]:
+    if _embedder is None:
+        return {"model": EMBEDDING_MODEL, "loaded": False}
+    return _embedder.metrics()
+
+class EmbedPool:
+    """Multi-process encoding shared by every write of one long run (e.g. an ingest).
+
+    Writes arrive in small batches, so the decision is made on the running total:
+    the encoder processes start once EMBED_MULTIPROCESS_MIN_DOCS documents have
+    gone through, and small runs never pay the start-up cost.
+    """
+    def __init__(self, min_docs: int = EMBED_MULTIPROCESS_MIN_DOCS):
+        self.embedder = get_embedder()
+        self.min_docs = min_docs
+        self.encoded = 0
+        self.pool = None
+
+    @property
+    def processes(self) -> int:
+        return len(self.pool["processes"]) if self.pool is not None else 1
+
+    def encode_array(self, texts: List[str]) -> np.ndarray:
+        self.encoded += len(texts)
+        if self.pool is None and self.encoded >= self.min_docs:
+            self.pool = self.embedder.start_pool()
+        return self.embedder.encode_array(texts, self.pool)
+
+    def close(self):
+        if self.pool is not None:
+            self.embedder.stop_pool(self.pool)
+            self.pool = None
+
+    def __enter__(self) -> "EmbedPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 # --- 2. VECTOR STORE (Handles ChromaDB) ---
+DEFAULT_COLLECTION = "finadapt_docs"
+DEFAULT_PERSIST_DIR = "./rag_data/vector_store"
+
+# Shared Chroma handles, keyed by persist dir and (persist dir, collection)
+_chroma_clients: Dict[str, Any] = {}
+_chroma_collections: Dict[tuple, Any] = {}
+_lexical_indexes: Dict[tuple, BM25Index] = {}
+_chroma_lock = threading.Lock()
+
+def get_chroma_collection(collection_name: str = DEFAULT_COLLECTION, persist_dir: str = DEFAULT_PERSIST_DIR):
+    """Return the (client, collection) pair for this store, opening it only on first use."""
+    path = os.path.abspath(persist_dir)
+    key = (path, collection_name)
+    with _chroma_lock:
+        client = _chroma_clients.get(path)
+        if client is None:
+            client = chromadb.PersistentClient(path=path)
+            _chroma_clients[path] = client
+        collection = _chroma_collections.get(key)
+        if collection is None:
+            collection = client.get_or_create_collection(name=collection_name)
+            _chroma_collections[key] = collection
+        return client, collection
+
+def get_lexical_index(collection_name: str = DEFAULT_COLLECTION, persist_dir: str = DEFAULT_PERSIST_DIR) -> BM25Index:
+    """The BM25 index shadowing a collection; one per process, filled on first search."""
+    key = (os.path.abspath(persist_dir), collection_name)
+    with _chroma_lock:
+        index = _lexical_indexes.get(key)
+        if index is None:
+            index = BM25Index()
+            _lexical_indexes[key] = index
+        return index
+
+# --- TENANT SCOPING ---
+# Every chunk carries {"tenant_id", "created_at"}. Ingested knowledge is SHARED_TENANT
+# and visible to everyone; a user's uploads are only visible to that user.
+SHARED_TENANT = "shared"
+UNASSIGNED_TENANT = "unassigned"  # Uploads with no owner (anonymous, or from before tagging): visible to nobody
+RESERVED_TENANTS = frozenset({SHARED_TENANT, UNASSIGNED_TENANT})  # Never valid as a caller's user id
+
+def tenant_metadata(tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """Metadata every write records: owner and write time (epoch seconds, filterable with $gte/$lte)."""
+    return {"tenant_id": tenant_id or SHARED_TENANT, "created_at": int(time.time())}
+
+def scope_tenants(tenant_id: Optional[str] = None) -> Set[str]:
+    # A reserved name as the caller's id must not widen the scope (e.g. to every anonymous upload)
+    return {SHARED_TENANT, tenant_id} if tenant_id and tenant_id not in RESERVED_TENANTS else {SHARED_TENANT}
+
+def scope_filter(tenant_id: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, Any]:
+    """Chroma `where` for what one user may see, optionally limited to chunks written in [since, until]."""
+    clauses: List[Dict[str, Any]] = [{"tenant_id": {"$in": sorted(scope_tenants(tenant_id))}}]
+    if since is not None:
+        clauses.append({"created_at": {"$gte": since}})
+    if until is not None:
+        clauses.append({"created_at": {"$lte": until}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def tenant_collection_name(tenant_id: str) -> str:
+    # Chroma names: 3-63 chars of [a-zA-Z0-9._-]; the hash keeps distinct ids distinct after slugging
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", tenant_id)[:32].strip("-_") or "user"
+    digest = hashlib.sha1(tenant_id.encode("utf-8")).hexdigest()[:8]
+    return f"{DEFAULT_COLLECTION}_{slug}_{digest}"
+
+def close_chroma_clients():
+    """Drop every pooled handle. Call on app shutdown."""
+    with _chroma_lock:
+        for client in _chroma_clients.values():
+            clear_cache = getattr(client, "clear_system_cache", None)
+            if clear_cache:
+                clear_cache()
+        _chroma_collections.clear()
+        _chroma_clients.clear()
+        _lexical_indexes.clear()
+
 class VectorStore:
-    def __init__(self, collection_name: str = "finadapt_docs", persist_dir: str = "./rag_data/vector_store"):
-        self.client = chromadb.PersistentClient(path=persist_dir)
-        self.collection = self.client.get_or_create_collection(name=collection_name)
-
-    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str]):
-        embeddings = EmbeddingManager().get_embeddings(documents)
-        self.collection.add(
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            ids=ids
-        )
+    def __init__(self, collection_name: str = DEFAULT_COLLECTION, persist_dir: str = DEFAULT_PERSIST_DIR):
+        self.client, self.collection = get_chroma_collection(collection_name, persist_dir)
+        self.lexical = get_lexical_index(collection_name, persist_dir)
+
+    @classmethod
+    def for_tenant(cls, tenant_id: Optional[str] = None, persist_dir: str = DEFAULT_PERSIST_DIR) -> "VectorStore":
+        """Where this tenant's uploads live: its own collection with TENANT_COLLECTIONS, else the shared one."""
+        if TENANT_COLLECTIONS and tenant_id and tenant_id not in (SHARED_TENANT, UNASSIGNED_TENANT):
+            return cls(tenant_collection_name(tenant_id), persist_dir)
+        return cls(persist_dir=persist_dir)
+
+    def _index_lexical(self, ids: List[str], documents: List[str], metadatas: List[dict]):
+        # Before the first build the index is empty; the build will read these back from Chroma
+        if self.lexical.built:
+            self.lexical.add(ids, documents, [(m or {}).get("tenant_id") for m in metadatas])
+
+    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str],
+                      batch_size: int = EMBED_BATCH_SIZE, pool: Optional[EmbedPool] = None):
+        """Embed and store documents. Long runs pass one EmbedPool to every call."""
+        encoder = pool or get_embedder()
+        if pool is not None:
+            # Bigger write batches so each one keeps every encoder process busy
+            batch_size *= pool.processes
+        if len(documents) <= batch_size:
+            self.collection.add(
+                documents=documents,
+                embeddings=encoder.encode_array(documents),
+                metadatas=metadatas,
+                ids=ids
+            )
+            self._index_lexical(ids, documents, metadatas)
+        else:
+            self._add_pipelined(encoder, documents, metadatas, ids, batch_size)
+        # New knowledge can change answers, so cached ones are no longer safe
+        answer_cache.invalidate()
+
+    def _add_pipelined(self, encoder: Union[EmbeddingManager, EmbedPool], documents: List[str], metadatas: List[dict],
+                       ids: List[str], batch_size: int):
+        """Encode batch N+1 on a worker thread while batch N is written to Chroma."""
+        batches: "queue.Queue" = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        _done = object()
+
+        def produce():
+            try:
+                for start in range(0, len(documents), batch_size):
+                    if stop.is_set():
+                        return
+                    end = start + batch_size
+                    batches.put((start, end, encoder.encode_array(documents[start:end])))
+                batches.put(_done)
+            except Exception as e:
+                batches.put(e)
+
+        producer = threading.Thread(target=produce, name="embed-producer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is _done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, end, embeddings = item
+                self.collection.add(
+                    documents=documents[start:end],
+                    embeddings=embeddings,
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+                self._index_lexical(ids[start:end], documents[start:end], metadatas[start:end])
+        finally:
+            stop.set()
+            # Unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.1)
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        self.collection.delete(ids=ids)
+        self.lexical.remove(ids)
+        answer_cache.invalidate()
+
+    def ids_where(self, where: Dict[str, Any]) -> List[str]:
+        """Ids of every chunk matching a metadata filter."""
+        return self.collection.get(where=where, include=[])["ids"]
 
-    def search(self, query_embedding: list, top_k: int = 5):
+    def existing_ids(self, ids: List[str]) -> set:
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def add_chunks(
+        self,
+        chunks: Iterable[Chunk],
+        metadata_fn: Callable[[Chunk], dict],
+        batch_size: int = 64,
+        pool: Optional[EmbedPool] = None,
+    ) -> Dict[str, int]:
+        """Consume a chunk generator in batches, embedding only ids not already stored."""
+        stats = {"added": 0, "skipped": 0}
+        batch: List[Chunk] = []
+
+        def flush():
+            # Duplicate ids inside one batch (repeated text) would make Chroma reject it
+            unique = list({chunk.id: chunk for chunk in batch}.values())
+            stored = self.existing_ids([chunk.id for chunk in unique])
+            new = [chunk for chunk in unique if chunk.id not in stored]
+            stats["skipped"] += len(batch) - len(new)
+            if new:
+                self.add_documents(
+                    [chunk.text for chunk in new],
+                    [metadata_fn(chunk) for chunk in new],
+                    [chunk.id for chunk in new],
+                    pool=pool,
+                )
+                stats["added"] += len(new)
+            batch.clear()
+
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return stats
+
+    def search(self, query_embedding: list, top_k: int = 5, where: Optional[Dict[str, Any]] = None):
+        """Nearest chunks, optionally restricted by a metadata filter such as scope_filter(tenant_id)."""
+        return self.search_many([query_embedding], top_k=top_k, where=where)
+
+    def search_many(self, query_embeddings: List[list], top_k: int = 5, where: Optional[Dict[str, Any]] = None):
+        """One Chroma round-trip for several query vectors. Results are indexed per query."""
         return self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            **({"where": where} if where else {})
         )
 
-# --- 3. THE RAG LOGIC (The "Thinking" Part) ---
-def get_rag_response(user_query: str):
-    try:
-        # Initialize components
-        embedder = EmbeddingManager()
-        db = VectorStore()
-        
-        # 1. Expand Query (Hybrid Search Logic from Notebook)
-        expanded_queries = [user_query]
-        if any(x in user_query.lower() for x in ["how", "what", "explain", "plan"]):
-             expanded_queries.append(f"Detailed explanation of {user_query}")
-
-        # 2. Retrieve Documents
-        unique_results = {}
-        for q in expanded_queries:
-            q_embed = embedder.embed_query(q)
-            results = db.search(q_embed, top_k=3)
-            
-            if results['documents']:
-                for i, doc_text in enumerate(results['documents'][0]):
-                    doc_id = results['ids'][0][i]
-                    if doc_id not in unique_results:
-                        unique_results[doc_id] = doc_text
-
-        # 3. Construct Context
-        context_text = "\n\n".join(unique_results.values())
-        if not context_text:
-            return "I couldn't find specific details in my knowledge base, but I can try to answer based on general financial principles."
-
-        # 4. Ask Groq (Llama 3 70B)
-        llm = ChatGroq(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama-3.3-70b-versatile",
-            temperature=0.1
+    def _pages(self, include: List[str]):
+        for offset in range(0, self.collection.count(), REBUILD_PAGE_SIZE):
+            yield self.collection.get(include=include, limit=REBUILD_PAGE_SIZE, offset=offset)
+
+    def backfill_tenant_metadata(self) -> int:
+        """Tag chunks written before tenant scoping: ingested docs become shared, old uploads unassigned."""
+        untagged_ids, metadatas = [], []
+        for page in self._pages(["metadatas"]):
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                metadata = dict(metadata or {})
+                if "tenant_id" in metadata:
+                    continue
+                metadata["tenant_id"] = UNASSIGNED_TENANT if metadata.get("type") == "upload" else SHARED_TENANT
+                metadata.setdefault("created_at", 0)
+                untagged_ids.append(doc_id)
+                metadatas.append(metadata)
+        for start in range(0, len(untagged_ids), REBUILD_PAGE_SIZE):
+            end = start + REBUILD_PAGE_SIZE
+            self.collection.update(ids=untagged_ids[start:end], metadatas=metadatas[start:end])
+        if untagged_ids:
+            self.lexical.built = False  # Tenants changed; rebuild on next search
+        return len(untagged_ids)
+
+    def _rebuild_lexical(self):
+        start = time.perf_counter()
+        self.lexical.rebuild(
+            (page["ids"], page["documents"], [(m or {}).get("tenant_id") for m in page["metadatas"]])
+            for page in self._pages(["documents", "metadatas"])
+        )
+        logging.getLogger(__name__).info(
+            "BM25 index built: %d chunks in %.0f ms", len(self.lexical), (time.perf_counter() - start) * 1000
+        )
+
+    def _refresh_lexical(self):
+        try:
+            self._rebuild_lexical()
+        except Exception:
+            logging.getLogger(__name__).exception("BM25 background rebuild failed")
+        finally:
+            self.lexical.refreshing = False
+
+    def ensure_lexical_index(self):
+        """Build the BM25 index on first use. After that, at most every LEXICAL_REFRESH_SECONDS,
+        compare it with the collection; if another process wrote, rebuild in the background and
+        keep serving the current index. Writes from this process are indexed immediately;
+        other processes' writes appear within about one interval plus one rebuild."""
+        if not self.lexical.built:
+            self._rebuild_lexical()
+            self.lexical.checked_at = time.monotonic()
+            return
+        if not self.lexical.claim_check(LEXICAL_REFRESH_SECONDS):
+            return
+        if len(self.lexical) != self.collection.count():
+            self.lexical.refreshing = True
+            threading.Thread(target=self._refresh_lexical, name="bm25-refresh", daemon=True).start()
+
+    def search_lexical(self, query: str, top_k: int = 5, tenants: Optional[Set[str]] = None,
+                       where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """BM25 hits in the same shape as the dense ones (distance None, score = BM25).
+        Tenants are filtered inside the index; `where` (e.g. dates) is applied when fetching the text."""
+        self.ensure_lexical_index()
+        ranked = self.lexical.search(query, top_k, tenants=tenants)
+        if not ranked:
+            return []
+        found = self.collection.get(
+            ids=[doc_id for doc_id, _ in ranked], include=["documents", "metadatas"],
+            **({"where": where} if where else {})
         )
-        
-        prompt = f"""
-        You are FinAdapt's expert financial AI. Use the context below to answer the user's question.
-        
-        CONTEXT FROM DOCUMENTS:
-        {context_text}
-        
-        USER QUESTION: {user_query}
-        
-        Answer professionally and concisely. If the context doesn't have the answer, admit it.
-        """
-        
-        response = llm.invoke(prompt)
+        rows = {doc_id: (found["documents"][i], found["metadatas"][i]) for i, doc_id in enumerate(found["ids"])}
+        return [
+            {"id": doc_id, "text": rows[doc_id][0], "distance": None, "metadata": rows[doc_id][1], "bm25": score}
+            for doc_id, score in ranked if doc_id in rows
+        ]
+
+# --- 3. RETRIEVAL (Query expansion + BM25 + rank fusion) ---
+RRF_K = 60
+
+def expand_query(user_query: str) -> List[str]:
+    expanded_queries = [user_query]
+    if any(x in user_query.lower() for x in ["how", "what", "explain", "plan"]):
+        expanded_queries.append(f"Detailed explanation of {user_query}")
+    return expanded_queries
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Merge several ranked hit lists into one, deduped by id.
+
+    Each hit is a dict with at least ``id``; the fused hit keeps the first copy seen
+    and gets ``score = sum(1 / (k + rank))`` over every list it appears in.
+    Ties are broken by the best (lowest) distance.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for hits in ranked_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.get(hit["id"])
+            if entry is None:
+                entry = dict(hit, score=0.0)
+                fused[hit["id"]] = entry
+            entry["score"] += 1.0 / (k + rank)
+            distance = hit.get("distance")
+            if distance is not None and (entry.get("distance") is None or distance < entry["distance"]):
+                entry["distance"] = distance
+    return sorted(
+        fused.values(),
+        key=lambda h: (-h["score"], h["distance"] if h.get("distance") is not None else float("inf"))
+    )
+
+def _hits_from_query_result(results: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    """Turn a Chroma query result into one ranked hit list per query."""
+    ranked_lists = []
+    distances = results.get("distances") or []
+    metadatas = results.get("metadatas") or []
+    for q_idx, ids in enumerate(results.get("ids") or []):
+        docs = results["documents"][q_idx]
+        q_distances = distances[q_idx] if q_idx < len(distances) and distances[q_idx] else [None] * len(ids)
+        q_metadatas = metadatas[q_idx] if q_idx < len(metadatas) and metadatas[q_idx] else [None] * len(ids)
+        ranked_lists.append([
+            {"id": doc_id, "text": docs[i], "distance": q_distances[i], "metadata": q_metadatas[i]}
+            for i, doc_id in enumerate(ids)
+        ])
+    return ranked_lists
+
+def _retrieve(user_query: str, top_k: int, tenant_id: Optional[str] = None,
+              since: Optional[int] = None, until: Optional[int] = None):
+    queries = expand_query(user_query)
+    query_embeddings = get_embedder().embed_queries(queries)
+    where = scope_filter(tenant_id, since, until)
+    tenants = scope_tenants(tenant_id)
+    # Shared knowledge base, plus the user's own collection when tenants are partitioned
+    stores = [VectorStore()]
+    if TENANT_COLLECTIONS and tenant_id:
+        stores.append(VectorStore.for_tenant(tenant_id))
+    candidates = max(top_k, RETRIEVAL_CANDIDATES)
+    ranked_lists = []
+    for store in stores:
+        ranked_lists.extend(_hits_from_query_result(store.search_many(query_embeddings, top_k=candidates, where=where)))
+        if HYBRID_SEARCH:
+            ranked_lists.append(store.search_lexical(user_query, top_k=candidates, tenants=tenants, where=where))
+    # Deeper candidate lists, fewer chunks kept: recall goes up while the prompt stays small
+    return reciprocal_rank_fusion(ranked_lists)[:top_k], query_embeddings[0]
+
+def retrieve(user_query: str, top_k: int = 3, tenant_id: Optional[str] = None,
+             since: Optional[int] = None, until: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Dense search over the expanded queries plus BM25 on the original, fused into the best top_k.
+    Only shared chunks and `tenant_id`'s own are considered; since/until bound created_at."""
+    hits, _ = _retrieve(user_query, top_k, tenant_id, since, until)
+    return hits
+
+# --- 4. THE RAG LOGIC (The "Thinking" Part) ---
+NO_CONTEXT_ANSWER = "I couldn't find specific details in my knowledge base, but I can try to answer based on general financial principles."
+
+def _record_hop(timings: Optional[Dict[str, float]], hop: str, started: float):
+    if timings is not None:
+        timings[hop] = round((time.perf_counter() - started) * 1000, 2)
+
+def _build_scoped_context(user_query: str, tenant_id: Optional[str], since: Optional[int],
+                          until: Optional[int], timings: Optional[Dict[str, float]]):
+    # 1. Retrieve Documents (expanded queries, batched + fused, scoped to the user)
+    started = time.perf_counter()
+    hits, query_embedding = _retrieve(user_query, top_k=3, tenant_id=tenant_id, since=since, until=until)
+    _record_hop(timings, "retrieve", started)
+
+    # 2. Construct Context (overlap removed, best chunks first, within the token budget)
+    started = time.perf_counter()
+    context = build_context(hits)
+    _record_hop(timings, "context", started)
+    return context, query_embedding
+
+def _prepare_rag(user_query: str, use_cache: bool, tenant_id: Optional[str],
+                 since: Optional[int], until: Optional[int], timings: Optional[Dict[str, float]] = None):
+    """Everything before the LLM call. Returns (answer, prompt, query_embedding, cache_key);
+    `answer` is set when no generation is needed (no context, or a cache hit)."""
+    context, query_embedding = _build_scoped_context(user_query, tenant_id, since, until, timings)
+    context_text = context.text
+    if not context_text:
+        return NO_CONTEXT_ANSWER, None, None, None
+
+    # Same question + same chunks -> reuse the previous answer
+    cache_key = chunk_key(context.chunk_ids)
+    if use_cache:
+        cached_answer = answer_cache.lookup(query_embedding, cache_key)
+        if cached_answer is not None:
+            return cached_answer, None, None, None
+
+    prompt = f"""You are FinAdapt's expert financial AI. Use the context below to answer the user's question.
+
+CONTEXT FROM DOCUMENTS:
+{context_text}
+
+USER QUESTION: {user_query}
+
+Answer professionally and concisely. If the context doesn't have the answer, admit it."""
+    prompt_stats.record(count_tokens(prompt), context)
+    return None, prompt, query_embedding, cache_key
+
+def get_rag_response(user_query: str, use_cache: bool = False, tenant_id: Optional[str] = None,
+                     since: Optional[int] = None, until: Optional[int] = None,
+                     timings: Optional[Dict[str, float]] = None):
+    """Retrieve, then one Groq generation. Per-hop milliseconds are written to `timings` if given."""
+    try:
+        answer, prompt, query_embedding, cache_key = _prepare_rag(user_query, use_cache, tenant_id, since, until, timings)
+        if answer is not None:
+            return answer
+
+        # 3. Ask Groq (Llama 3 70B)
+        started = time.perf_counter()
+        response = get_groq_llm().invoke(prompt)
+        _record_hop(timings, "generate", started)
+        if use_cache:
+            answer_cache.store(query_embedding, cache_key, response.content)
         return response.content
 
     except Exception as e:
-        return f"Error in RAG Engine: {str(e)}"
\ No newline at end of file
+        return f"Error in RAG Engine: {str(e)}"
+
+def stream_rag_response(user_query: str, use_cache: bool = False, tenant_id: Optional[str] = None,
+                        since: Optional[int] = None, until: Optional[int] = None,
+                        timings: Optional[Dict[str, float]] = None) -> Iterator[str]:
+    """get_rag_response, yielding the answer in pieces as Groq generates it.
+
+    Errors are raised, not yielded as text, so the SSE layer can send them as an `error` event.
+    """
+    answer, prompt, query_embedding, cache_key = _prepare_rag(user_query, use_cache, tenant_id, since, until, timings)
+    if answer is not None:
+        yield answer
+        return
+
+    parts = []
+    started = time.perf_counter()
+    for chunk in get_groq_llm().stream(prompt):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield chunk.content
+    _record_hop(timings, "generate", started)
+    # Only complete answers are cached; a client hanging up closes us before this line
+    if use_cache:
+        answer_cache.store(query_embedding, cache_key, "".join(parts))
+
+def get_rag_context(user_query: str, tenant_id: Optional[str] = None, since: Optional[int] = None,
+                    until: Optional[int] = None, timings: Optional[Dict[str, float]] = None) -> str:
+    """Ranked, deduped document excerpts for an outer agent to answer from. No LLM call."""
+    try:
+        context, _ = _build_scoped_context(user_query, tenant_id, since, until, timings)
+        if not context.text:
+            return "No relevant documents were found in the knowledge base."
+        return f"Document excerpts, most relevant first:\n\n{context.text}"
+    except Exception as e:
+        return f"Error in RAG Engine: {str(e)}"
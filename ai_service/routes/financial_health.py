@@ -1,7 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, Dict, Any, List, AsyncIterator, Iterator
+from dataclasses import asdict
+from datetime import datetime, timezone
+import json
+import math
 import logging
 import sys
 import os
@@ -10,13 +14,21 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from services.financial_health import FinancialHealthService, FinancialMetrics
+from services.state_store import create_state_store
+from services.compact_state import CompactFinancialState
+from services.score_history import create_history_store
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# In-memory storage for demonstration
-# In a real application, use a database
-financial_data_store: Dict[str, Any] = {}
+# Latest result per user as CompactFinancialState: bounded hot cache backed by SQLite
+# (see services/state_store.py and services/compact_state.py)
+financial_data_store = create_state_store()
+# Score + component metrics over time, for deltas and trends
+score_history = create_history_store()
+
+# Records scored per vectorised pass in /analyze-batch
+BATCH_CHUNK_SIZE = int(os.getenv("FINANCIAL_HEALTH_BATCH_SIZE", "5000"))
 
 class FinancialHealthRequest(BaseModel):
     user_id: str
@@ -29,19 +41,108 @@ class FinancialHealthResponse(BaseModel):
     last_updated: str
     message: Optional[str] = None
 
+def _stored_state(metrics: FinancialMetrics, result: Dict[str, Any]) -> CompactFinancialState:
+    return CompactFinancialState.from_result(metrics, result)
+
+def _history_entry(user_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    return {'user_id': user_id, 'score': result['score'], **result['metrics']}
+
+def store_result(user_id: str, metrics: FinancialMetrics, result: Dict[str, Any]):
+    financial_data_store.upsert(user_id, _stored_state(metrics, result))
+    score_history.append_many([_history_entry(user_id, result)])
+
+def _finite(value: Optional[float]) -> Optional[float]:
+    # inf income/expense ratios (no expenses) aren't valid JSON
+    return value if value is None or math.isfinite(value) else None
+
+async def _iter_batch_records(request: Request) -> AsyncIterator[Any]:
+    """Yield raw records from an NDJSON stream (read incrementally) or a JSON array body."""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+    else:
+        body = await request.json()
+        if not isinstance(body, list):
+            raise TypeError("Expected a JSON array")
+        for record in body:
+            yield record
+
+def _score_batch(service: FinancialHealthService, batch: List[FinancialHealthRequest]) -> List[str]:
+    previous = financial_data_store.get_many([item.user_id for item in batch])
+    results = service.analyze_financial_health_batch(
+        [asdict(item.metrics) for item in batch],
+        previous_scores=[previous[item.user_id].score if item.user_id in previous else None for item in batch]
+    )
+    # One durable write for the whole chunk
+    financial_data_store.upsert_many(
+        (item.user_id, _stored_state(item.metrics, result)) for item, result in zip(batch, results)
+    )
+    score_history.append_many([_history_entry(item.user_id, result) for item, result in zip(batch, results)])
+    lines = []
+    for item, result in zip(batch, results):
+        metrics = {name: _finite(value) for name, value in result['metrics'].items()}
+        lines.append(json.dumps({'user_id': item.user_id, **result, 'metrics': metrics}) + "\n")
+    return lines
+
+@router.post("/analyze-batch")
+async def analyze_financial_health_batch(request: Request):
+    """
+    Score many users in one request. Body: JSON array or NDJSON (Content-Type:
+    application/x-ndjson) of {user_id, metrics}. Results stream back as NDJSON,
+    one line per user; invalid records get an {"user_id", "error"} line instead.
+    """
+    # The body is fully read before streaming starts: Starlette can't read the
+    # request while a StreamingResponse is being sent. NDJSON is still parsed line by line.
+    try:
+        records = [record async for record in _iter_batch_records(request)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array or NDJSON")
+
+    service = FinancialHealthService()
+
+    def results() -> Iterator[str]:
+        batch: List[FinancialHealthRequest] = []
+        try:
+            for record in records:
+                try:
+                    batch.append(FinancialHealthRequest(**record))
+                except (ValidationError, TypeError) as e:
+                    user_id = record.get('user_id') if isinstance(record, dict) else None
+                    yield json.dumps({'user_id': user_id, 'error': str(e)}) + "\n"
+                    continue
+                if len(batch) >= BATCH_CHUNK_SIZE:
+                    yield from _score_batch(service, batch)
+                    batch = []
+            if batch:
+                yield from _score_batch(service, batch)
+        except Exception as e:
+            logger.error(f"Error in batch financial health analysis: {str(e)}")
+            yield json.dumps({'error': f"Batch aborted: {str(e)}"}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @router.post("/analyze", response_model=FinancialHealthResponse)
 async def analyze_financial_health(request: FinancialHealthRequest):
     """
     Analyze financial health and return the tree state and score
     """
     try:
-        service = FinancialHealthService()
-        
         # Get previous score if exists
         previous_score = None
-        if request.user_id in financial_data_store:
-            previous_data = financial_data_store[request.user_id]
-            previous_score = previous_data.get('score')
+        previous_state = financial_data_store.get(request.user_id)
+        if previous_state is not None:
+            previous_score = previous_state.score
+
+        # The previous score drives the growing/wilting/shaking animations
+        service = FinancialHealthService(previous_score=previous_score)
         
         # Analyze financial health
         result = service.analyze_financial_health({
@@ -56,12 +157,7 @@ async def analyze_financial_health(request: FinancialHealthRequest):
         })
         
         # Store the result
-        financial_data_store[request.user_id] = {
-            'score': result['score'],
-            'metrics': request.metrics.dict(),
-            'last_updated': datetime.utcnow().isoformat(),
-            'tree_state': result['tree_state']
-        }
+        store_result(request.user_id, request.metrics, result)
         
         # Prepare response
         response = FinancialHealthResponse(
@@ -81,19 +177,60 @@ async def analyze_financial_health(request: FinancialHealthRequest):
             detail=f"Error analyzing financial health: {str(e)}"
         )
 
+def _epoch(value: Optional[datetime]) -> Optional[int]:
+    # Naive datetimes are UTC, matching the timestamps this API returns
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+@router.get("/{user_id}/history")
+async def get_financial_health_history(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1, le=5000),
+    window: int = Query(10, ge=2, le=500)
+):
+    """
+    Score history for a user, optionally limited to [start, end] and the newest `limit` points,
+    plus the latest delta, trend slope (points/day) and improving/declining streaks.
+    """
+    series = score_history.get(user_id)
+    if series is None or len(series) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No financial history found for this user"
+        )
+
+    points = series.points(
+        start_ts=_epoch(start),
+        end_ts=_epoch(end),
+        limit=limit
+    )
+    for point in points:
+        point['income_expense_ratio'] = _finite(point['income_expense_ratio'])
+        point['timestamp'] = datetime.utcfromtimestamp(point['timestamp']).isoformat()
+    return {
+        'user_id': user_id,
+        'trend': series.trend(window=window),
+        'points': points
+    }
+
 @router.get("/{user_id}", response_model=FinancialHealthResponse)
 async def get_financial_health(user_id: str):
     """
     Get the latest financial health data for a user
     """
     try:
-        if user_id not in financial_data_store:
+        state = financial_data_store.get(user_id)
+        if state is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No financial data found for this user"
             )
-            
-        data = financial_data_store[user_id]
+        data = state.to_dict()
         
         return FinancialHealthResponse(
             score=data['score'],
@@ -0,0 +1,167 @@
+import json
+import struct
+from dataclasses import asdict, astuple
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Union
+
+from services.financial_health import FinancialMetrics, TreeStateGenerator
+
+# --- COMPACT FINANCIAL STATE ---
+# The latest result per user, stored as the raw inputs plus the score instead of
+# the nested tree-state dict. The tree is a pure function of (metrics, score),
+# so it is rebuilt on demand; animation flags live in one bitmask and the
+# timestamp is an integer (microseconds since the epoch). to_dict() gives back
+# exactly the JSON shape the API has always stored and returned.
+
+_FORMAT_VERSION = 1
+# version, score, updated_at (us), animation flags, then the 8 metric fields
+_RECORD = struct.Struct("<Bdqb4dq3d")
+_METRICS = struct.Struct("<4dq3d")
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+GROWING, WILTING, SHAKING = 1, 2, 4
+_FLAG_NAMES = (("is_growing", GROWING), ("is_wilting", WILTING), ("is_shaking", SHAKING))
+
+def to_epoch_us(dt: datetime) -> int:
+    return (dt - _EPOCH) // _MICROSECOND
+
+def from_epoch_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+
+class CompactFinancialState:
+    __slots__ = ("score", "updated_at", "flags", "_metrics")
+
+    def __init__(self, metrics: FinancialMetrics, score: float, updated_at: int, flags: int = 0):
+        self._metrics = _METRICS.pack(*astuple(metrics))
+        self.score = score
+        self.updated_at = updated_at
+        self.flags = flags
+
+    @classmethod
+    def from_result(cls, metrics: FinancialMetrics, result: Dict[str, Any],
+                    updated_at: Optional[datetime] = None) -> "CompactFinancialState":
+        """Build from an analyze_financial_health(_batch) result."""
+        decorations = result.get('tree_state', {}).get('decorations', {})
+        flags = sum(bit for name, bit in _FLAG_NAMES if decorations.get(name))
+        return cls(metrics, result['score'], to_epoch_us(updated_at or datetime.utcnow()), flags)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompactFinancialState":
+        """Inverse of to_dict(); also reads rows written before the compact encoding."""
+        return cls.from_result(FinancialMetrics(**data['metrics']), data,
+                               datetime.fromisoformat(data['last_updated']))
+
+    @property
+    def metrics(self) -> FinancialMetrics:
+        return FinancialMetrics(*_METRICS.unpack(self._metrics))
+
+    @property
+    def last_updated(self) -> str:
+        return from_epoch_us(self.updated_at).isoformat()
+
+    def tree_state(self) -> Dict[str, Any]:
+        tree = TreeStateGenerator.generate_tree_state(self.metrics, self.score)
+        for name, bit in _FLAG_NAMES:
+            if self.flags & bit:
+                tree['decorations'][name] = True
+        tree['last_updated'] = self.last_updated
+        return tree
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'score': self.score,
+            'metrics': asdict(self.metrics),
+            'last_updated': self.last_updated,
+            'tree_state': self.tree_state()
+        }
+
+    def to_bytes(self) -> bytes:
+        return _RECORD.pack(_FORMAT_VERSION, self.score, self.updated_at, self.flags,
+                            *_METRICS.unpack(self._metrics))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "CompactFinancialState":
+        version, score, updated_at, flags, *values = _RECORD.unpack(blob)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unknown financial state format {version}")
+        return cls(FinancialMetrics(*values), score, updated_at, flags)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, CompactFinancialState) and self.to_bytes() == other.to_bytes()
+
+    def __repr__(self) -> str:
+        return f"CompactFinancialState(score={self.score}, updated_at={self.updated_at}, flags={self.flags})"
+
+
+def encode_state(state: CompactFinancialState) -> bytes:
+    return state.to_bytes()
+
+def decode_state(value: Union[bytes, str]) -> CompactFinancialState:
+    # Rows written before the compact encoding are JSON text
+    if isinstance(value, str):
+        return CompactFinancialState.from_dict(json.loads(value))
+    return CompactFinancialState.from_bytes(value)
+
+
+# --- BENCHMARK (Nested dict vs compact state, resident memory per user) ---
+# Run from ai_service/: python -m services.compact_state
+if __name__ == "__main__":
+    import random
+    import tracemalloc
+    from services.financial_health import FinancialHealthService
+
+    rng = random.Random(7)
+    service = FinancialHealthService(previous_score=50.0)
+    n = 50_000
+
+    def sample() -> FinancialMetrics:
+        return FinancialMetrics(
+            income=rng.uniform(0, 200000), expenses=rng.uniform(0, 200000), savings=rng.uniform(0, 50000),
+            bills_paid_on_time=rng.random(), savings_streak_days=rng.randint(0, 60),
+            unnecessary_spending=rng.random(), avg_income_last_3_months=rng.uniform(0, 200000),
+            avg_expenses_last_3_months=rng.uniform(0, 200000),
+        )
+
+    metrics = [sample() for _ in range(n)]
+    results = service.analyze_financial_health_batch([asdict(m) for m in metrics], previous_scores=[50.0] * n)
+
+    # Lossless: compact -> dict matches the legacy stored dict, and survives bytes + legacy JSON
+    for m, result in zip(metrics[:2000], results[:2000]):
+        now = datetime.utcnow()
+        result['tree_state']['last_updated'] = now.isoformat()
+        legacy = {'score': result['score'], 'metrics': asdict(m), 'last_updated': now.isoformat(),
+                  'tree_state': result['tree_state']}
+        state = CompactFinancialState.from_result(m, result, now)
+        assert state.to_dict() == legacy, (state.to_dict(), legacy)
+        assert decode_state(encode_state(state)).to_dict() == legacy
+        assert decode_state(json.dumps(legacy)) == state
+    print("✅ Compact state round-trips to the stored JSON shape (dict, bytes and legacy JSON).")
+
+    def measure(build) -> int:
+        tracemalloc.start()
+        held = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del held
+        return size
+
+    def legacy_states():
+        # What financial_data_store held before: nested dicts + ISO strings per user
+        return {
+            f"user-{i}": {
+                'score': r['score'], 'metrics': asdict(m), 'last_updated': datetime.utcnow().isoformat(),
+                'tree_state': json.loads(json.dumps(r['tree_state'])),
+            }
+            for i, (m, r) in enumerate(zip(metrics, results))
+        }
+
+    def compact_states():
+        return {f"user-{i}": CompactFinancialState.from_result(m, r) for i, (m, r) in enumerate(zip(metrics, results))}
+
+    legacy_bytes = measure(legacy_states)
+    compact_bytes = measure(compact_states)
+    json_row = len(json.dumps(legacy_states()["user-0"]))
+    print(f"📦 {n:,} users: nested dicts {legacy_bytes / n:,.0f} B/user, compact {compact_bytes / n:,.0f} B/user "
+          f"({legacy_bytes / compact_bytes:.1f}x smaller); SQLite row {json_row} B JSON -> {_RECORD.size} B")
@@ -1,10 +1,16 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Mapping
 from datetime import datetime, timedelta
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, astuple
 import math
+import numpy as np
 
 @dataclass
 class FinancialMetrics:
+    # No per-instance __dict__: millions of these are held by the batch and state paths
+    __slots__ = (
+        "income", "expenses", "savings", "bills_paid_on_time", "savings_streak_days",
+        "unnecessary_spending", "avg_income_last_3_months", "avg_expenses_last_3_months",
+    )
     income: float
     expenses: float
     savings: float
@@ -14,6 +20,19 @@ class FinancialMetrics:
     avg_income_last_3_months: float
     avg_expenses_last_3_months: float
 
+METRIC_FIELDS = [f.name for f in fields(FinancialMetrics)]
+
+def metrics_to_columns(metrics: List[FinancialMetrics]) -> Dict[str, np.ndarray]:
+    """Row objects -> one float64 array per metric (the layout the batch APIs take)."""
+    table = np.array([astuple(m) for m in metrics], dtype=np.float64).reshape(len(metrics), len(METRIC_FIELDS))
+    return {name: table[:, i] for i, name in enumerate(METRIC_FIELDS)}
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """numerator / denominator where mask is set, 0 elsewhere (no warnings)."""
+    out = np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=mask)
+    return out
+
 class FinancialHealthAnalyzer:
     @staticmethod
     def calculate_income_stability(income: float, avg_income_3m: float) -> float:
@@ -101,6 +120,50 @@ class FinancialHealthAnalyzer:
         total_score = income_stability + income_expense + savings + habits
         return min(max(total_score, 0), 100)
 
+    @staticmethod
+    def calculate_financial_scores_batch(columns: Mapping[str, Any]) -> Dict[str, np.ndarray]:
+        """Vectorised calculate_financial_score for N users at once.
+
+        `columns` maps each FinancialMetrics field to an array of length N.
+        Returns the total score and every component score as arrays, matching the
+        scalar methods value for value.
+        """
+        income = np.asarray(columns["income"], dtype=np.float64)
+        expenses = np.asarray(columns["expenses"], dtype=np.float64)
+        savings = np.asarray(columns["savings"], dtype=np.float64)
+        avg_income = np.asarray(columns["avg_income_last_3_months"], dtype=np.float64)
+
+        # Income stability (0-30)
+        has_avg = avg_income != 0
+        stability = np.minimum(_safe_divide(income, avg_income, has_avg) * 30, 30.0)
+        income_stability = np.where(has_avg, stability, np.where(income > 0, 30.0, 0.0))
+
+        # Income-expense ratio (0-30)
+        ratio = np.where(expenses > 0, _safe_divide(income, expenses, expenses > 0), np.inf)
+        income_expense = np.select([ratio >= 1.2, ratio >= 1.0, ratio >= 0.8], [30.0, 25.0, 15.0], 0.0)
+        income_expense = np.where(income == 0, 0.0, income_expense)
+
+        # Savings (0-25)
+        savings_rate = _safe_divide(savings, income, income != 0)
+        savings_score = np.select([savings_rate >= 0.20, savings_rate >= 0.10, savings_rate >= 0.05], [25.0, 20.0, 10.0], 0.0)
+        savings_score = np.where(income == 0, 0.0, savings_score)
+
+        # Habits (0-15)
+        habit_score = (
+            np.where(np.asarray(columns["bills_paid_on_time"], dtype=np.float64) >= 0.8, 5.0, 0.0)
+            + np.where(np.asarray(columns["savings_streak_days"], dtype=np.float64) >= 7, 5.0, 0.0)
+            + np.where(np.asarray(columns["unnecessary_spending"], dtype=np.float64) < 0.2, 5.0, 0.0)
+        )
+
+        total = income_stability + income_expense + savings_score + habit_score
+        return {
+            "score": np.clip(total, 0, 100),
+            "income_stability": income_stability,
+            "income_expense_score": income_expense,
+            "savings_score": savings_score,
+            "habit_score": habit_score,
+        }
+
 
 class TreeStateGenerator:
     @staticmethod
@@ -175,11 +238,41 @@ class TreeStateGenerator:
         }
 
 
+    @staticmethod
+    def generate_tree_states_batch(columns: Mapping[str, Any], scores: Any, base_length: float = 100.0) -> Dict[str, np.ndarray]:
+        """Vectorised generate_tree_state: one array per tree field (no timestamps / animation flags)."""
+        income = np.asarray(columns["income"], dtype=np.float64)
+        expenses = np.asarray(columns["expenses"], dtype=np.float64)
+        savings = np.asarray(columns["savings"], dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        savings_rate = _safe_divide(savings, income, income > 0)
+        has_expenses = expenses > 0
+        ratio = _safe_divide(income, expenses, expenses != 0)
+
+        leaf_color = np.select(
+            [expenses == 0, ratio >= 1.2, ratio >= 1.0, ratio >= 0.8],
+            ["green", "green", "light-green", "yellow"],
+            "red",
+        )
+        return {
+            "trunk_width": np.select([scores >= 80, scores >= 60, scores >= 40], [70.0, 55.0, 40.0], 25.0),
+            "trunk_health": scores / 100.0,
+            "branch_length": np.where(expenses == 0, base_length, np.minimum(base_length * ratio, base_length)),
+            "branch_health": np.where(has_expenses, np.minimum(ratio, 1.0), 1.0),
+            "leaf_count": np.clip(np.trunc(savings_rate * 100), 10, 100).astype(np.int64),
+            "leaf_color": leaf_color,
+            "leaf_health": np.where(has_expenses, np.minimum(ratio, 1.5), 1.5),
+            "has_flowers": savings_rate >= 0.20,
+            "has_fruits": scores >= 90,
+        }
+
+
 class FinancialHealthService:
-    def __init__(self):
+    def __init__(self, previous_score: Optional[float] = None):
         self.analyzer = FinancialHealthAnalyzer()
         self.tree_generator = TreeStateGenerator()
-        self.previous_score = None
+        self.previous_score = previous_score
         self.last_updated = None
 
     def analyze_financial_health(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
@@ -234,3 +327,130 @@ class FinancialHealthService:
             },
             'last_updated': self.last_updated.isoformat()
         }
+
+    def analyze_financial_health_batch(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        previous_scores: Optional[List[Optional[float]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Same output as analyze_financial_health for every entry, scored in one vectorised pass.
+        `previous_scores[i]` plays the role of previous_score for entry i (None = first analysis)."""
+        columns = {
+            name: np.array([m[name] for m in metrics_list], dtype=np.float64)
+            for name in METRIC_FIELDS
+        }
+        scores = self.analyzer.calculate_financial_scores_batch(columns)
+        trees = self.tree_generator.generate_tree_states_batch(columns, scores['score'])
+
+        income, expenses, savings = columns['income'], columns['expenses'], columns['savings']
+        income_expense_ratio = np.where(expenses > 0, _safe_divide(income, expenses, expenses > 0), np.inf)
+        savings_rate = _safe_divide(savings, income, income > 0)
+        timestamp = datetime.utcnow().isoformat()
+
+        # Animation flags, mirroring the previous_score branch of analyze_financial_health
+        previous = np.array(
+            [np.nan if p is None else p for p in (previous_scores or [None] * len(metrics_list))],
+            dtype=np.float64
+        )
+        has_previous = ~np.isnan(previous)
+        score_diff = scores['score'] - np.where(has_previous, previous, 0.0)
+        is_growing = has_previous & (score_diff >= 10)
+        is_wilting = has_previous & ((score_diff <= -10) | (columns['savings_streak_days'] == 0))
+        is_shaking = has_previous & (expenses > columns['avg_expenses_last_3_months'] * 1.5)
+
+        results = []
+        for i in range(len(metrics_list)):
+            score = float(scores['score'][i])
+            results.append({
+                'score': score,
+                'tree_state': {
+                    'trunk': {'width': float(trees['trunk_width'][i]), 'health': float(trees['trunk_health'][i])},
+                    'branches': {'length': float(trees['branch_length'][i]), 'health': float(trees['branch_health'][i])},
+                    'leaves': {
+                        'count': int(trees['leaf_count'][i]),
+                        'color': str(trees['leaf_color'][i]),
+                        'health': float(trees['leaf_health'][i])
+                    },
+                    'decorations': {
+                        'has_flowers': bool(trees['has_flowers'][i]),
+                        'has_fruits': bool(trees['has_fruits'][i]),
+                        'is_growing': bool(is_growing[i]),
+                        'is_wilting': bool(is_wilting[i]),
+                        **({'is_shaking': True} if is_shaking[i] else {})
+                    },
+                    'score': score,
+                    'last_updated': timestamp
+                },
+                'metrics': {
+                    'income_stability': float(scores['income_stability'][i]),
+                    'income_expense_ratio': float(income_expense_ratio[i]),
+                    'savings_rate': float(savings_rate[i]),
+                    'habit_score': float(scores['habit_score'][i])
+                },
+                'last_updated': timestamp
+            })
+        return results
+
+
+# --- TEST (Batch vs scalar equivalence + throughput) ---
+if __name__ == "__main__":
+    import random
+    import time
+
+    def random_metrics(rng: random.Random) -> FinancialMetrics:
+        # Mix of realistic values and the edge cases the scalar code branches on
+        def money():
+            return rng.choice([0.0, -500.0, rng.uniform(0, 200000), rng.uniform(0, 2000)])
+        return FinancialMetrics(
+            income=money(),
+            expenses=money(),
+            savings=rng.choice([0.0, money(), rng.uniform(-1000, 50000)]),
+            bills_paid_on_time=rng.choice([0.8, rng.random()]),
+            savings_streak_days=rng.choice([0, 7, rng.randint(0, 60)]),
+            unnecessary_spending=rng.choice([0.2, rng.random()]),
+            avg_income_last_3_months=money(),
+            avg_expenses_last_3_months=money(),
+        )
+
+    rng = random.Random(42)
+    sample = [random_metrics(rng) for _ in range(20000)]
+    columns = metrics_to_columns(sample)
+    batch = FinancialHealthAnalyzer.calculate_financial_scores_batch(columns)
+    trees = TreeStateGenerator.generate_tree_states_batch(columns, batch["score"])
+    for i, m in enumerate(sample):
+        score = FinancialHealthAnalyzer.calculate_financial_score(m)
+        tree = TreeStateGenerator.generate_tree_state(m, score)
+        assert batch["score"][i] == score, (i, m, batch["score"][i], score)
+        assert trees["trunk_width"][i] == tree["trunk"]["width"], (i, m)
+        assert trees["branch_length"][i] == tree["branches"]["length"], (i, m)
+        assert trees["branch_health"][i] == tree["branches"]["health"], (i, m)
+        assert trees["leaf_count"][i] == tree["leaves"]["count"], (i, m)
+        assert trees["leaf_color"][i] == tree["leaves"]["color"], (i, m)
+        assert trees["leaf_health"][i] == tree["leaves"]["health"], (i, m)
+        assert bool(trees["has_flowers"][i]) == tree["decorations"]["has_flowers"], (i, m)
+        assert bool(trees["has_fruits"][i]) == tree["decorations"]["has_fruits"], (i, m)
+    print(f"✅ Batch results match the scalar path for {len(sample)} random users.")
+
+    n = 1_000_000
+    np_rng = np.random.default_rng(0)
+    big = {
+        "income": np_rng.uniform(0, 200000, n),
+        "expenses": np_rng.uniform(0, 200000, n),
+        "savings": np_rng.uniform(0, 50000, n),
+        "bills_paid_on_time": np_rng.random(n),
+        "savings_streak_days": np_rng.integers(0, 60, n),
+        "unnecessary_spending": np_rng.random(n),
+        "avg_income_last_3_months": np_rng.uniform(0, 200000, n),
+        "avg_expenses_last_3_months": np_rng.uniform(0, 200000, n),
+    }
+    start = time.perf_counter()
+    scores = FinancialHealthAnalyzer.calculate_financial_scores_batch(big)
+    TreeStateGenerator.generate_tree_states_batch(big, scores["score"])
+    batch_s = time.perf_counter() - start
+
+    rows = [FinancialMetrics(*(float(big[f][i]) for f in METRIC_FIELDS)) for i in range(20000)]
+    start = time.perf_counter()
+    for m in rows:
+        TreeStateGenerator.generate_tree_state(m, FinancialHealthAnalyzer.calculate_financial_score(m))
+    scalar_rate = len(rows) / (time.perf_counter() - start)
+    print(f"⚡ Batch: {n:,} users in {batch_s:.2f}s ({n / batch_s:,.0f} users/s); scalar: {scalar_rate:,.0f} users/s")
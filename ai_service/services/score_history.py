@@ -0,0 +1,193 @@
+import os
+import time
+import struct
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# --- PER-USER SCORE HISTORY ---
+# Each user's history is a set of parallel typed arrays (int64 timestamps,
+# float32 values), serialised as one small blob. Old points are merged
+# pairwise once a series passes max_points, so recent data keeps full
+# resolution while storage stays bounded.
+
+HISTORY_FIELDS = ("score", "income_stability", "income_expense_ratio", "savings_rate", "habit_score")
+HISTORY_MAX_POINTS = int(os.getenv("FINANCIAL_HISTORY_MAX_POINTS", "512"))
+MIN_POINTS = 4  # Downsampling merges pairs from the older half; it needs at least two pairs
+HISTORY_RETENTION_DAYS = int(os.getenv("FINANCIAL_HISTORY_RETENTION_DAYS", "730"))
+_HEADER = struct.Struct("<I")
+
+class ScoreSeries:
+    def __init__(self):
+        self.ts = array("q")
+        self.values = {field: array("f") for field in HISTORY_FIELDS}
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def append(self, ts: int, values: Dict[str, float]):
+        # Append-only: a clock step backwards is clamped to keep timestamps sorted
+        if self.ts and ts < self.ts[-1]:
+            ts = self.ts[-1]
+        self.ts.append(ts)
+        for field in HISTORY_FIELDS:
+            self.values[field].append(float(values.get(field, 0.0)))
+
+    def apply_retention(self, min_ts: int):
+        cut = bisect_left(self.ts, min_ts)
+        if cut:
+            del self.ts[:cut]
+            for field in HISTORY_FIELDS:
+                del self.values[field][:cut]
+
+    def downsample(self, max_points: int):
+        """Average adjacent pairs in the older half until the series fits."""
+        max_points = max(max_points, MIN_POINTS)
+        while len(self.ts) > max_points:
+            older = (len(self.ts) // 2) & ~1
+            if older == 0:
+                break
+            ts = np.frombuffer(self.ts, dtype=np.int64)
+            merged_ts = ts[1:older:2]  # keep the later timestamp of each pair
+            self.ts = array("q", merged_ts.tobytes()) + self.ts[older:]
+            for field in HISTORY_FIELDS:
+                vals = np.frombuffer(self.values[field], dtype=np.float32)
+                merged = ((vals[0:older:2] + vals[1:older:2]) / 2).astype(np.float32)
+                self.values[field] = array("f", merged.tobytes()) + self.values[field][older:]
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(len(self.ts)), self.ts.tobytes()]
+        parts.extend(self.values[field].tobytes() for field in HISTORY_FIELDS)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "ScoreSeries":
+        series = cls()
+        (count,) = _HEADER.unpack_from(blob)
+        offset = _HEADER.size
+        series.ts.frombytes(blob[offset:offset + 8 * count])
+        offset += 8 * count
+        for field in HISTORY_FIELDS:
+            series.values[field].frombytes(blob[offset:offset + 4 * count])
+            offset += 4 * count
+        return series
+
+    def points(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        lo = bisect_left(self.ts, start_ts) if start_ts is not None else 0
+        hi = bisect_right(self.ts, end_ts) if end_ts is not None else len(self.ts)
+        if limit is not None:
+            lo = max(lo, hi - limit)  # newest `limit` points in the range
+        return [
+            {"timestamp": self.ts[i], **{field: float(self.values[field][i]) for field in HISTORY_FIELDS}}
+            for i in range(lo, hi)
+        ]
+
+    def trend(self, window: int = 10) -> Dict[str, Any]:
+        """Latest delta, least-squares slope (points/day) over the last `window` points and streaks."""
+        scores = np.frombuffer(self.values["score"], dtype=np.float32).astype(np.float64)
+        n = len(scores)
+        delta = float(scores[-1] - scores[-2]) if n >= 2 else None
+
+        slope = None
+        if n >= 2:
+            days = np.frombuffer(self.ts, dtype=np.int64)[-window:].astype(np.float64) / 86400.0
+            if days[-1] > days[0]:
+                slope = float(np.polyfit(days - days[0], scores[-window:], 1)[0])
+
+        # Consecutive rises / falls counted back from the newest point
+        steps = np.sign(np.diff(scores))[::-1]
+        def run_length(sign: int) -> int:
+            mismatch = np.flatnonzero(steps != sign)
+            return int(mismatch[0]) if len(mismatch) else len(steps)
+
+        return {
+            "points": n,
+            "latest_score": float(scores[-1]) if n else None,
+            "delta": delta,
+            "slope_per_day": slope,
+            "improving_streak": run_length(1),
+            "declining_streak": run_length(-1),
+        }
+
+
+class ScoreHistoryStore:
+    """User id -> ScoreSeries, in memory or in a SQLite file shared by all workers."""
+    def __init__(self, path: Optional[str] = None, max_points: int = HISTORY_MAX_POINTS,
+                 retention_days: int = HISTORY_RETENTION_DAYS):
+        self.max_points = max(max_points, MIN_POINTS)
+        self.retention_seconds = retention_days * 86400
+        self._lock = threading.Lock()
+        self._memory: Dict[str, ScoreSeries] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS score_history (user_id TEXT PRIMARY KEY, series BLOB NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _load(self, user_id: str) -> Optional[ScoreSeries]:
+        if self._conn is None:
+            return self._memory.get(user_id)
+        row = self._conn.execute("SELECT series FROM score_history WHERE user_id = ?", (user_id,)).fetchone()
+        return ScoreSeries.from_bytes(row[0]) if row else None
+
+    def get(self, user_id: str) -> Optional[ScoreSeries]:
+        with self._lock:
+            return self._load(user_id)
+
+    def append_many(self, entries: List[Dict[str, Any]], ts: Optional[int] = None):
+        """entries: [{"user_id": ..., <HISTORY_FIELDS>...}] recorded at `ts` (default now)."""
+        ts = int(time.time()) if ts is None else ts
+        with self._lock:
+            # BEGIN IMMEDIATE so two workers can't interleave read-modify-write on a series
+            if self._conn is not None:
+                self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A user can appear more than once per call (e.g. a batch chunk): load each
+                # series once, append every entry to it, write it once
+                touched: Dict[str, ScoreSeries] = {}
+                for entry in entries:
+                    user_id = entry["user_id"]
+                    series = touched.get(user_id)
+                    if series is None:
+                        series = touched[user_id] = self._load(user_id) or ScoreSeries()
+                    series.append(ts, entry)
+                    series.apply_retention(ts - self.retention_seconds)
+                    series.downsample(self.max_points)
+                if self._conn is None:
+                    self._memory.update(touched)
+                else:
+                    self._conn.executemany(
+                        "INSERT INTO score_history (user_id, series) VALUES (?, ?)"
+                        " ON CONFLICT(user_id) DO UPDATE SET series = excluded.series",
+                        [(user_id, series.to_bytes()) for user_id, series in touched.items()],
+                    )
+                    self._conn.commit()
+            except Exception:
+                if self._conn is not None:
+                    self._conn.rollback()
+                raise
+
+    def append(self, user_id: str, values: Dict[str, float], ts: Optional[int] = None):
+        self.append_many([{"user_id": user_id, **values}], ts=ts)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_history_store() -> ScoreHistoryStore:
+    if os.getenv("FINANCIAL_STATE_BACKEND", "sqlite").lower() == "memory":
+        return ScoreHistoryStore()
+    # Its own file: commits here must not bump the state store's data_version,
+    # which would flush that store's hot LRU on every write
+    return ScoreHistoryStore(os.getenv("FINANCIAL_HISTORY_DB", "./rag_data/financial_history.sqlite3"))
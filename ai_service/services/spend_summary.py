@@ -0,0 +1,88 @@
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# --- SPEND SUMMARY (Exact numbers computed locally for the CFO agent) ---
+# Accepts both shapes we see in practice:
+#   cleaner output  -> {"merchant", "amount" (signed), "category", "payment_method", ...}
+#   backend records -> {"title", "amount" (positive), "type": "income"|"expense", "category", "date"}
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    try:
+        # Records mix "2024-11-01" and full ISO timestamps
+        return pd.to_datetime(values, errors="coerce", utc=True, format="mixed")
+    except (TypeError, ValueError):  # pandas < 2.0 has no format="mixed"
+        return pd.to_datetime(values, errors="coerce", utc=True)
+
+def _frame(transactions: List[Dict[str, Any]]) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(transactions)
+    n = len(df)
+
+    def column(*names, default=None) -> pd.Series:
+        present = [df[name] for name in names if name in df.columns]
+        if not present:
+            return pd.Series([default] * n, index=df.index, dtype=object)
+        # Mixed records: each row takes the first of `names` it actually has
+        values = present[0]
+        for fallback in present[1:]:
+            values = values.fillna(fallback)
+        return values
+
+    amount = pd.to_numeric(column("amount", default=0.0), errors="coerce").fillna(0.0)
+    kind = column("type").astype(str).str.lower()
+    # Backend records carry the direction in `type` rather than the sign
+    amount = np.where(kind == "expense", -amount.abs(), np.where(kind == "income", amount.abs(), amount))
+
+    return pd.DataFrame({
+        "amount": amount.astype(float),
+        "category": column("category", default="Uncategorised").fillna("Uncategorised").astype(str),
+        "merchant": column("merchant", "title", default="Unknown").fillna("Unknown").astype(str),
+        "payment_method": column("payment_method", default="Unknown").fillna("Unknown").astype(str),
+        "flagged": column("flagged", default=False).fillna(False).astype(bool),
+        "date": _parse_dates(column("date", "createdAt")),
+    })
+
+def _top(series: pd.Series, top_n: int) -> Dict[str, float]:
+    return {str(k): round(float(v), 2) for k, v in series.sort_values(ascending=False).head(top_n).items()}
+
+def summarise_transactions(transactions: List[Dict[str, Any]], top_n: int = 5) -> Dict[str, Any]:
+    """Group-by totals over amount, category, merchant, payment method and month."""
+    if not transactions:
+        return {
+            "transaction_count": 0, "total_spend": 0.0, "total_income": 0.0, "net_cashflow": 0.0,
+            "primary_expense_category": "None",
+        }
+
+    df = _frame(transactions)
+    expenses = df[df["amount"] < 0].assign(spend=lambda d: -d["amount"])
+    income = df.loc[df["amount"] > 0, "amount"]
+
+    by_category = expenses.groupby("category")["spend"].sum()
+    summary: Dict[str, Any] = {
+        "transaction_count": int(len(df)),
+        "expense_count": int(len(expenses)),
+        "income_count": int(len(income)),
+        "total_spend": round(float(expenses["spend"].sum()), 2),
+        "total_income": round(float(income.sum()), 2),
+        "net_cashflow": round(float(df["amount"].sum()), 2),
+        "primary_expense_category": str(by_category.idxmax()) if len(by_category) else "None",
+        "spend_by_category": _top(by_category, top_n),
+        "spend_by_merchant": _top(expenses.groupby("merchant")["spend"].sum(), top_n),
+        "spend_by_payment_method": _top(expenses.groupby("payment_method")["spend"].sum(), top_n),
+        "largest_expenses": [
+            {"merchant": row.merchant, "category": row.category, "amount": round(float(row.spend), 2)}
+            for row in expenses.nlargest(min(3, top_n), "spend").itertuples()
+        ],
+        "flagged_count": int(df["flagged"].sum()),
+    }
+
+    dated = expenses.dropna(subset=["date"])
+    if len(dated):
+        month = dated["date"].dt.tz_localize(None).dt.to_period("M").astype(str)
+        summary["spend_by_month"] = {
+            k: round(float(v), 2) for k, v in dated.groupby(month)["spend"].sum().sort_index().items()
+        }
+        summary["spend_by_weekday"] = _top(dated.groupby(dated["date"].dt.day_name())["spend"].sum(), 7)
+
+    return summary
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# --- FINANCIAL HEALTH STATE STORE ---
+# Latest result per user. Backends share one small interface so the route
+# doesn't care whether state lives in memory or on disk. Values are opaque to
+# the stores; the SQLite backend takes an encode/decode pair (JSON by default).
+
+class StateStore(ABC):
+    @abstractmethod
+    def get(self, user_id: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def upsert(self, user_id: str, data: Any):
+        ...
+
+    def upsert_many(self, items: Iterable[Tuple[str, Any]]):
+        for user_id, data in items:
+            self.upsert(user_id, data)
+
+    def get_many(self, user_ids: List[str]) -> Dict[str, Any]:
+        found = {}
+        for user_id in user_ids:
+            data = self.get(user_id)
+            if data is not None:
+                found[user_id] = data
+        return found
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    def close(self):
+        pass
+
+
+class InMemoryLRUStore(StateStore):
+    """Bounded dict: least recently used users are dropped past max_entries."""
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[Any]:
+        with self._lock:
+            data = self._data.get(user_id)
+            if data is not None:
+                self._data.move_to_end(user_id)
+            return data
+
+    def upsert(self, user_id: str, data: Any):
+        with self._lock:
+            self._data[user_id] = data
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, user_id: str):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStateStore(StateStore):
+    """Durable store in a WAL-mode SQLite file, safe to share between uvicorn workers."""
+    def __init__(self, path: str, encode: Callable[[Any], Any] = json.dumps,
+                 decode: Callable[[Any], Any] = json.loads):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS financial_state ("
+            " user_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL,"
+            " seq INTEGER NOT NULL DEFAULT 0)"
+        )
+        # seq: bumped on every write, in commit order, so readers can ask what changed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(financial_state)")}
+        if "seq" not in columns:
+            self._conn.execute("ALTER TABLE financial_state ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS financial_state_seq ON financial_state (seq)")
+        self._conn.commit()
+
+    def get(self, user_id: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM financial_state WHERE user_id = ?", (user_id,)).fetchone()
+        return self.decode(row[0]) if row else None
+
+    def upsert(self, user_id: str, data: Any):
+        self.upsert_many([(user_id, data)])
+
+    def upsert_many(self, items: Iterable[Tuple[str, Any]]) -> Dict[str, int]:
+        """Write the rows in one transaction; returns user id -> the seq its row now has."""
+        now = time.time()
+        rows = [(user_id, self.encode(data), now) for user_id, data in items]
+        if not rows:
+            return {}
+        with self._lock:
+            # The INSERT takes the write lock first, so MAX(seq) + 1 can't collide across workers
+            self._conn.executemany(
+                "INSERT INTO financial_state (user_id, data, updated_at, seq)"
+                " VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM financial_state))"
+                " ON CONFLICT(user_id) DO UPDATE SET"
+                " data = excluded.data, updated_at = excluded.updated_at, seq = excluded.seq",
+                rows,
+            )
+            # Still holding the write lock: our rows took the last len(rows) seqs, in order
+            first = self._conn.execute("SELECT MAX(seq) FROM financial_state").fetchone()[0] - len(rows) + 1
+            self._conn.commit()
+        return {user_id: first + i for i, (user_id, _, _) in enumerate(rows)}
+
+    def get_many(self, user_ids: List[str]) -> Dict[str, Any]:
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                for user_id, data in self._conn.execute(
+                    f"SELECT user_id, data FROM financial_state WHERE user_id IN ({placeholders})", chunk
+                ):
+                    found[user_id] = self.decode(data)
+        return found
+
+    def data_version(self) -> int:
+        """Changes whenever another connection (e.g. another worker) commits."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def max_seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM financial_state").fetchone()[0]
+
+    def changed_since(self, seq: int) -> Tuple[List[Tuple[str, int]], int]:
+        """(user id, seq) of rows written after `seq`, and the newest seq seen."""
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, seq FROM financial_state WHERE seq > ?", (seq,)).fetchall()
+        return rows, max((row_seq for _, row_seq in rows), default=seq)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredStateStore(StateStore):
+    """Hot LRU in front of the durable store. Writes go to both.
+
+    Consistency: this process always reads its own writes. Another worker's
+    write to a user is seen here within `sync_interval` seconds: at most that
+    often we check SQLite's data_version and, if anyone else committed, evict
+    just the users whose rows changed. The rest of the LRU stays warm.
+    """
+    def __init__(self, durable: SQLiteStateStore, hot: InMemoryLRUStore, sync_interval: float = 0.25):
+        self.durable = durable
+        self.hot = hot
+        self.sync_interval = sync_interval
+        self._sync_lock = threading.Lock()
+        self._seen_version = durable.data_version()
+        self._seen_seq = durable.max_seq()
+        self._own_seqs: Dict[str, int] = {}  # our writes not yet accounted for by a sync
+        self._synced_at = time.monotonic()
+
+    def _sync(self):
+        now = time.monotonic()
+        with self._sync_lock:
+            if now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+            own_max = max(self._own_seqs.values(), default=self._seen_seq)
+            version = self.durable.data_version()
+            if version == self._seen_version:
+                # Nobody else committed, so every newer seq up to own_max is ours
+                stale = []
+                self._seen_seq = max(self._seen_seq, own_max)
+            else:
+                self._seen_version = version
+                changed, self._seen_seq = self.durable.changed_since(self._seen_seq)
+                stale = [user_id for user_id, seq in changed if self._own_seqs.get(user_id) != seq]
+            self._own_seqs = {user_id: seq for user_id, seq in self._own_seqs.items() if seq > self._seen_seq}
+        for user_id in stale:
+            self.hot.discard(user_id)
+
+    def get(self, user_id: str) -> Optional[Any]:
+        self._sync()
+        data = self.hot.get(user_id)
+        if data is None:
+            data = self.durable.get(user_id)
+            if data is not None:
+                self.hot.upsert(user_id, data)
+        return data
+
+    def upsert(self, user_id: str, data: Any):
+        self.upsert_many([(user_id, data)])
+
+    def upsert_many(self, items: Iterable[Tuple[str, Any]]):
+        items = list(items)
+        self._sync()
+        seqs = self.durable.upsert_many(items)
+        with self._sync_lock:
+            self._own_seqs.update(seqs)
+        for user_id, data in items:
+            self.hot.upsert(user_id, data)
+
+    def get_many(self, user_ids: List[str]) -> Dict[str, Any]:
+        self._sync()
+        found, missing = {}, []
+        for user_id in user_ids:
+            data = self.hot.get(user_id)
+            if data is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = data
+        for user_id, data in self.durable.get_many(missing).items():
+            self.hot.upsert(user_id, data)
+            found[user_id] = data
+        return found
+
+    def close(self):
+        self.durable.close()
+
+
+def create_state_store() -> StateStore:
+    """FINANCIAL_STATE_BACKEND=memory for a single-process demo, sqlite (default) otherwise."""
+    backend = os.getenv("FINANCIAL_STATE_BACKEND", "sqlite").lower()
+    hot = InMemoryLRUStore(max_entries=int(os.getenv("FINANCIAL_STATE_CACHE_SIZE", "100000")))
+    if backend == "memory":
+        return hot
+    # Compact records (see services/compact_state.py); legacy JSON rows still decode
+    from services.compact_state import decode_state, encode_state
+    durable = SQLiteStateStore(
+        os.getenv("FINANCIAL_STATE_DB", "./rag_data/financial_state.sqlite3"),
+        encode=encode_state, decode=decode_state
+    )
+    return TieredStateStore(durable, hot, sync_interval=int(os.getenv("FINANCIAL_STATE_SYNC_MS", "250")) / 1000)
@@ -0,0 +1,175 @@
+import re
+from typing import Dict, List, Optional, Tuple, Any
+
+# --- RULE-BASED STATEMENT PARSER (Fast path before the cleaner LLM) ---
+# Handles the regular line formats Indian banks export, e.g.
+#   2024-11-20 | UPI/29384/DOMINOS PIZZA | -450.00
+#   21/11/2024  NEFT/N3245/ACME PAYROLL  85,000.00 Cr  1,02,340.00
+# Returns dicts shaped like agents.cleaner.MongoTransaction. Anything it isn't
+# sure about is handed back so the LLM can deal with it.
+
+PARSER_VERSION = "3"  # Bump when rules change so cached cleaner output is refreshed
+FLAG_EXPENSE_ABOVE = 50000.0
+
+# keyword in description -> (clean merchant name, category)
+MERCHANTS: Dict[str, Tuple[str, str]] = {
+    "SALARY": ("Employer", "Salary"),
+    "PAYROLL": ("Employer", "Salary"),
+    "DOMINOS": ("Dominos Pizza", "Food"),
+    "SWIGGY": ("Swiggy", "Food"),
+    "ZOMATO": ("Zomato", "Food"),
+    "STARBUCKS": ("Starbucks", "Food"),
+    "MCDONALD": ("McDonald's", "Food"),
+    "KFC": ("KFC", "Food"),
+    "BIGBASKET": ("BigBasket", "Food"),
+    "BLINKIT": ("Blinkit", "Food"),
+    "ZEPTO": ("Zepto", "Food"),
+    "UBER": ("Uber", "Travel"),
+    "OLA": ("Ola", "Travel"),
+    "RAPIDO": ("Rapido", "Travel"),
+    "IRCTC": ("IRCTC", "Travel"),
+    "UTS": ("Local Train", "Travel"),
+    "LOCAL TRAIN": ("Local Train", "Travel"),
+    "METRO": ("Metro", "Travel"),
+    "INDIGO": ("IndiGo", "Travel"),
+    "FASTAG": ("FASTag", "Travel"),
+    "NETFLIX": ("Netflix", "Entertainment"),
+    "SPOTIFY": ("Spotify", "Entertainment"),
+    "HOTSTAR": ("Hotstar", "Entertainment"),
+    "PRIME VIDEO": ("Prime Video", "Entertainment"),
+    "BOOKMYSHOW": ("BookMyShow", "Entertainment"),
+    "AMAZON": ("Amazon", "Shopping"),
+    "FLIPKART": ("Flipkart", "Shopping"),
+    "MYNTRA": ("Myntra", "Shopping"),
+    "AJIO": ("Ajio", "Shopping"),
+    "AIRTEL": ("Airtel", "Bills"),
+    "JIO": ("Jio", "Bills"),
+    "VODAFONE": ("Vi", "Bills"),
+    "BESCOM": ("BESCOM", "Bills"),
+    "MSEDCL": ("MSEDCL", "Bills"),
+    "ADANI ELECTRICITY": ("Adani Electricity", "Bills"),
+    "TATA POWER": ("Tata Power", "Bills"),
+    "ELECTRICITY": ("Electricity", "Bills"),
+    "RENT": ("Rent", "Bills"),
+    "LIC": ("LIC", "Bills"),
+    "ZERODHA": ("Zerodha", "Investment"),
+    "GROWW": ("Groww", "Investment"),
+    "MUTUAL FUND": ("Mutual Fund", "Investment"),
+    "SIP": ("SIP", "Investment"),
+    "PPF": ("PPF", "Investment"),
+}
+# Longest keyword first so "LOCAL TRAIN" wins over "TRAIN"-like substrings
+_MERCHANT_PATTERNS = [
+    (re.compile(rf"(?<![A-Z]){re.escape(keyword)}(?![A-Z])"), name, category)
+    for keyword, (name, category) in sorted(MERCHANTS.items(), key=lambda kv: -len(kv[0]))
+]
+
+PAYMENT_RULES = [
+    (re.compile(r"\bUPI\b"), "UPI"),
+    (re.compile(r"\b(NEFT|IMPS|RTGS|ACH|NACH|ECS|NETBANKING|NET BANKING|INB)\b"), "Netbanking"),
+    (re.compile(r"\b(POS|CARD|VISA|MASTERCARD|RUPAY|DEBIT CARD|CREDIT CARD)\b"), "Card"),
+    (re.compile(r"\b(ATM|CASH|CSH)\b"), "Cash"),
+]
+CREDIT_HINTS = re.compile(r"\b(CR|CREDIT|CRED|SALARY|REFUND|INTEREST|PAYOUT|EARNINGS|SETTLEMENT|TIPS)\b")
+# UPI moves money both ways, so it says nothing about direction
+DEBIT_HINTS = re.compile(r"\b(DR|DEBIT|POS|ATM|PURCHASE)\b")
+# Credits that are the user's own earnings, not money coming back from a purchase
+INCOME_HINTS = re.compile(r"\b(PAYOUT|EARNINGS?|SETTLEMENT|TIPS?|INCENTIVES?)\b")
+REFUND_HINTS = re.compile(r"\b(REFUND|REVERSAL|CASHBACK)\b")
+# Gig platforms our users work for: a credit from one of them is pay, not Food/Travel spend
+GIG_PLATFORMS = frozenset({"Swiggy", "Zomato", "Uber", "Ola", "Rapido", "Blinkit", "Zepto", "Amazon", "Flipkart"})
+
+_DATE = (
+    r"(?P<date>\d{4}-\d{2}-\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4}"
+    r"|\d{1,2}[ -](?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[ -]\d{2,4})"
+)
+_CURRENCY = r"(?:₹|Rs\.?|INR)"
+_AMOUNT = rf"(?P<amount>[+-]?\s?{_CURRENCY}?\s?\d[\d,]*(?:\.\d{{1,2}})?)\s*(?P<drcr>Cr|Dr|CR|DR)?"
+_LEADING_INDEX = re.compile(r"^\s*\d{1,4}[.)]\s+")
+_PIPE_LINE = re.compile(rf"^{_DATE}\s*\|\s*(?P<desc>[^|]+?)\s*\|\s*{_AMOUNT}\s*(?:\|.*)?$")
+_SPACE_LINE = re.compile(
+    rf"^{_DATE}\s+(?P<desc>.+?)\s+{_AMOUNT}"
+    rf"(?:\s+(?P<balance>[+-]?\d[\d,]*(?:\.\d{{1,2}})?\s*(?:Cr|Dr|CR|DR)?))?\s*$"
+)
+_MARKED = re.compile(r"^[+-]|Cr|Dr|CR|DR")
+
+def _to_float(amount: str) -> float:
+    # Drop the currency first, or the dot in "Rs." is read as a decimal point
+    return float(re.sub(r"[^\d.]", "", re.sub(_CURRENCY, "", amount)))
+
+def _ambiguous_balance(match: "re.Match[str]") -> bool:
+    # "SWIGGY 12 450.00" could be an amount of 12 with a balance of 450, or an
+    # amount of 450 after a number in the description. Only trust a trailing
+    # balance column when a sign or Cr/Dr marks which column is which.
+    if not match.groupdict().get("balance"):
+        return False
+    marks = (match.group("amount").strip(), match.group("drcr") or "", match.group("balance").strip())
+    return not any(_MARKED.search(text) for text in marks)
+
+def _payment_method(desc: str) -> str:
+    for pattern, method in PAYMENT_RULES:
+        if pattern.search(desc):
+            return method
+    return "Netbanking"
+
+def _merchant(desc: str) -> Optional[Tuple[str, str]]:
+    for pattern, name, category in _MERCHANT_PATTERNS:
+        if pattern.search(desc):
+            return name, category
+    return None
+
+def parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """One statement line -> MongoTransaction-shaped dict, or None if unsure."""
+    line = _LEADING_INDEX.sub("", line.strip())
+    match = _PIPE_LINE.match(line) or _SPACE_LINE.match(line)
+    if not match or _ambiguous_balance(match):
+        return None
+
+    desc = match.group("desc").upper()
+    merchant = _merchant(desc)
+    if merchant is None:
+        return None
+    name, category = merchant
+
+    raw_amount = match.group("amount").replace(" ", "")
+    drcr = (match.group("drcr") or "").upper()
+    amount = _to_float(raw_amount)
+    if raw_amount.startswith("-") or drcr == "DR":
+        amount = -amount
+    elif raw_amount.startswith("+") or drcr == "CR":
+        pass
+    elif category == "Salary" or CREDIT_HINTS.search(desc):
+        pass
+    elif DEBIT_HINTS.search(desc):
+        amount = -amount
+    else:
+        return None  # Direction unknown
+
+    if amount > 0 and category != "Salary" and not REFUND_HINTS.search(desc):
+        if INCOME_HINTS.search(desc) or name in GIG_PLATFORMS:
+            category = "Salary"
+
+    return {
+        "merchant": name,
+        "amount": amount,
+        "category": category,
+        "payment_method": _payment_method(desc),
+        "flagged": amount <= -FLAG_EXPENSE_ABOVE,
+        "summary": f"{category} {'income' if amount > 0 else 'expense'} ({name})",
+    }
+
+def parse_statement(raw_text: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Split a statement into (parsed transactions, lines the LLM still needs to see).
+
+    Lines without any digit (headers, bank boilerplate) can't be transactions and are dropped.
+    """
+    parsed, leftovers = [], []
+    for line in raw_text.splitlines():
+        if not line.strip():
+            continue
+        transaction = parse_line(line)
+        if transaction is not None:
+            parsed.append(transaction)
+        elif any(ch.isdigit() for ch in line):
+            leftovers.append(line.strip())
+    return parsed, leftovers